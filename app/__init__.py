@@ -1,13 +1,32 @@
 from flask import Flask
+from config import Config
+from app.models import registry
+from app.utils.log_config import setup_logging
 
 
 def create_app():
+    setup_logging()
     app = Flask(__name__, template_folder="../templates")
     app.config['SECRET_KEY'] = 'your_secret_key'
 
     # 注册蓝图
     with app.app_context():
-        from .routes import main
-        app.register_blueprint(main)
+        routes = registry.timed_import("app.routes")
+        app.register_blueprint(routes.main)
+
+        # 开始收集各阶段耗时（/metrics）
+        routes.metrics.install()
+
+        # 加载表结构目录
+        schema_catalog = registry.timed_import("app.lib.schema_catalog")
+        schema_catalog.get_catalog(Config.TRAIN_DATABASE_PATH)
+
+        # 预热向量库客户端与索引句柄
+        pinecone_client = registry.timed_import("app.utils.pinecone_client")
+        pinecone_client.warm_up(Config.WARMUP_INDEXES)
+
+        # 预加载需要的模型（为空时在首次请求时加载）
+        registry.warm_up(Config.WARMUP_MODELS)
+        registry.log_startup_report()
 
     return app
@@ -0,0 +1,97 @@
+"""
+ASGI 入口：POST /query/async 由 asyncio 版本的流程处理，其余请求交给 Flask 应用。
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+"""
+import json
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+from app.models import async_rag
+from app.utils.log_config import payload, sampled
+
+logger = logging.getLogger(__name__)
+
+flask_app = WsgiToAsgi(create_app())
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def query_async(scope, receive, send):
+    """与 Flask 的 /query 相同的请求与返回格式"""
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or "question" not in data:
+        logger.warning("No question provided in the request.")
+        return await send_json(send, 400, {"error": "No question provided"})
+
+    question = str(data.get("question") or "").strip()
+    if not question:
+        logger.warning("Received an empty question.")
+        return await send_json(send, 400, {"error": "Question cannot be empty"})
+
+    if sampled("received_question"):
+        logger.info("Received async question: %s", payload(question))
+    rag_result = await async_rag.generate_response_async(question)
+
+    if not rag_result or "answer" not in rag_result:
+        logger.error("RAG system failed to provide a valid answer.")
+        return await send_json(send, 500, {"error": "Failed to process the question"})
+    if rag_result.get("busy"):
+        return await send_json(send, 503, {"error": rag_result["answer"]})
+    if rag_result.get("unavailable"):
+        return await send_json(send, 502, {"error": rag_result["answer"]})
+
+    await send_json(send, 200, {
+        "answer": rag_result["answer"],
+        "path": rag_result.get("path"),
+        "status": rag_result.get("status"),
+        "truncated": rag_result.get("truncated", False),
+    })
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_rag.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(scope, receive, send)
+    if scope["type"] == "http" and scope["path"] == "/query/async":
+        if scope["method"] != "POST":
+            return await send_json(send, 405, {"error": "Method Not Allowed"})
+        return await query_async(scope, receive, send)
+    return await flask_app(scope, receive, send)
@@ -0,0 +1,104 @@
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.lib.table import Table
+from app.utils.log_config import setup_logging
+
+
+def parse_chunk(lines, lower=True):
+    """在工作进程中解析一批 tables.jsonl 行，返回已完成小写化的 Table 列表"""
+    tables = []
+    for line in lines:
+        if not line.strip():
+            continue
+        table = Table.from_dict(json.loads(line))
+        table.rows = table.lowered_rows(lower)
+        tables.append(table)
+    return tables
+
+
+def iter_chunks(fname, chunk_size):
+    chunk = []
+    with open(fname, encoding='utf-8') as f:
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_parsed(fname, workers, chunk_size, lower):
+    """并行解析输入文件，按文件顺序产出 Table；同时在途的批次数有上限，内存占用固定"""
+    if workers <= 1:
+        for chunk in iter_chunks(fname, chunk_size):
+            yield from parse_chunk(chunk, lower)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in iter_chunks(fname, chunk_size):
+            pending.append(executor.submit(parse_chunk, chunk, lower))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def load_tables(fdb, fname, workers=4, chunk_size=500, rows_per_txn=200000, replace_existing=False, lower=True):
+    """把 WikiSQL tables.jsonl 批量写入 SQLite，返回 (表数, 行数)"""
+    conn = sqlite3.connect(fdb, isolation_level=None)
+    # 构建期间放宽持久性要求，中途失败时重新构建即可
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+    n_tables = n_rows = txn_rows = 0
+    start = time.perf_counter()
+    try:
+        conn.execute('BEGIN')
+        for table in iter_parsed(fname, workers, chunk_size, lower):
+            inserted = table.bulk_create(conn, replace_existing=replace_existing, lower=False)
+            n_tables += 1
+            n_rows += inserted
+            txn_rows += inserted
+            if txn_rows >= rows_per_txn:
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                txn_rows = 0
+                logging.info(f"Loaded {n_tables} tables / {n_rows} rows ({n_rows / (time.perf_counter() - start):.0f} rows/s)")
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    logging.info(f"Loaded {n_tables} tables / {n_rows} rows into {fdb} in {time.perf_counter() - start:.1f}s")
+    return n_tables, n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从 WikiSQL tables.jsonl 构建 SQLite 数据库')
+    parser.add_argument('tables', help='tables.jsonl 文件')
+    parser.add_argument('--db', default='data/train.db')
+    parser.add_argument('--workers', type=int, default=4, help='解析输入文件的进程数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每个解析任务包含的行数')
+    parser.add_argument('--rows-per-txn', type=int, default=200000, help='每个事务插入的行数')
+    parser.add_argument('--replace', action='store_true', help='替换已存在的同名表')
+    parser.add_argument('--no-lower', action='store_true', help='保留单元格原始大小写')
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    load_tables(args.db, args.tables, workers=args.workers, chunk_size=args.chunk_size,
+                rows_per_txn=args.rows_per_txn, replace_existing=args.replace, lower=not args.no_lower)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,18 @@ import records
 import re
 from babel.numbers import parse_decimal, NumberFormatError
 from app.lib.query import Query
+from app.lib.schema_catalog import get_catalog
 
 
-schema_re = re.compile(r'\((.+)\)')
 num_re = re.compile(r'[-+]?\d*\.\d+|\d+')
 
 
 class DBEngine:
 
-    def __init__(self, fdb):
+    def __init__(self, fdb, catalog=None):
         self.db = records.Database('sqlite:///{}'.format(fdb))
         self.conn = self.db.get_connection()
+        self.catalog = catalog if catalog is not None else get_catalog(fdb)
 
     def execute_query(self, table_id, query, *args, **kwargs):
         return self.execute(table_id, query.sel_index, query.agg_index, query.conditions, *args, **kwargs)
@@ -20,12 +21,11 @@ class DBEngine:
     def execute(self, table_id, select_index, aggregation_index, conditions, lower=True):
         if not table_id.startswith('table'):
             table_id = 'table_{}'.format(table_id.replace('-', '_'))
-        table_info = self.conn.query('SELECT sql from sqlite_master WHERE tbl_name = :name', name=table_id).all()[0].sql
-        schema_str = schema_re.findall(table_info)[0]
-        schema = {}
-        for tup in schema_str.split(', '):
-            c, t = tup.split()
-            schema[c] = t
+        self.catalog.refresh_if_changed()
+        table_schema = self.catalog.get(table_id)
+        if table_schema is None:
+            raise ValueError('Unknown table {}'.format(table_id))
+        schema = dict(zip(table_schema.columns, table_schema.types))
         select = 'col{}'.format(select_index)
         agg = Query.agg_ops[aggregation_index]
         if agg:
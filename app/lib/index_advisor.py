@@ -0,0 +1,163 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+from tabulate import tabulate
+
+from app.lib.query import Query
+from app.lib.schema_catalog import SchemaCatalog, table_name
+from app.utils.log_config import setup_logging
+from app.utils.query_log import query_log_files
+from config import Config
+
+
+from_re = re.compile(r'\bFROM\s+[`"]?(table_\w+)', flags=re.IGNORECASE)
+cond_re = re.compile(
+    r'\b(col\d+)\s*(=|>|<)\s*(\'(?:[^\']|\'\')*\'|[-+]?\d*\.?\d+)(\s+COLLATE\s+NOCASE)?',
+    flags=re.IGNORECASE
+)
+
+
+class IndexAdvisor:
+    """根据工作负载中 (表, 列, 操作符) 的出现频率为 train.db 建议并创建索引"""
+
+    def __init__(self, fdb):
+        self.fdb = fdb
+        self.catalog = SchemaCatalog(fdb)
+        self.counts = Counter()
+        self.samples = {}
+
+    def _add(self, table, col, op, nocase, value):
+        key = (table, col, op, nocase)
+        self.counts[key] += 1
+        self.samples.setdefault(key, value)
+
+    def mine_dataset(self, fname):
+        """统计 WikiSQL 数据文件中 sql.conds 的 (表, 列, 操作符)"""
+        with open(fname, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                d = json.loads(line)
+                table = table_name(d['table_id'])
+                for col, op, val in d['sql']['conds']:
+                    if op >= len(Query.cond_ops) - 1:
+                        continue
+                    # rag_model 的提示要求文本比较使用 COLLATE NOCASE
+                    nocase = op == 0 and isinstance(val, str)
+                    self._add(table, 'col{}'.format(col), Query.cond_ops[op], nocase, val)
+
+    def mine_query_log(self, fname):
+        """统计 QueryLog 中记录的线上 SQL 的过滤条件"""
+        with open(fname, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                sql = json.loads(line)['sql']
+                m = from_re.search(sql)
+                if not m:
+                    continue
+                for col, op, val, nocase in cond_re.findall(sql):
+                    if val.startswith("'"):
+                        val = val[1:-1].replace("''", "'")
+                    self._add(m.group(1), col.lower(), op, bool(nocase), val)
+
+    def recommend(self, min_count=1, min_rows=0):
+        """返回建议的索引列表：[{"table", "column", "nocase", "count", "op", "value"}]"""
+        merged = {}
+        for (table, col, op, nocase), count in self.counts.items():
+            schema = self.catalog.get(table)
+            if schema is None or col not in schema.columns or schema.row_count < min_rows:
+                continue
+            # 范围查询只能使用二进制排序的索引，因此只有等值比较才建 NOCASE 索引
+            key = (table, col, nocase and op == '=')
+            entry = merged.setdefault(key, {
+                'table': table, 'column': col, 'nocase': key[2], 'count': 0,
+                'op': op, 'value': self.samples[(table, col, op, nocase)],
+            })
+            entry['count'] += count
+        recs = [r for r in merged.values() if r['count'] >= min_count]
+        return sorted(recs, key=lambda r: (r['table'], -r['count']))
+
+    @staticmethod
+    def index_name(rec):
+        return 'idx_{}_{}{}'.format(rec['table'], rec['column'], '_nocase' if rec['nocase'] else '')
+
+    @staticmethod
+    def _probe_sql(rec):
+        collate = ' COLLATE NOCASE' if rec['nocase'] else ''
+        return 'SELECT count(*) FROM "{}" WHERE {} {} ?{}'.format(rec['table'], rec['column'], rec['op'], collate)
+
+    def _time(self, conn, rec, repeat):
+        sql = self._probe_sql(rec)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, (rec['value'],)).fetchall()
+        return (time.perf_counter() - start) / repeat
+
+    def apply(self, recs, repeat=20, dry_run=False):
+        """创建索引并返回每张表建索引前后的平均查询耗时（秒）"""
+        conn = sqlite3.connect(self.fdb)
+        report = {}
+        try:
+            for rec in recs:
+                report.setdefault(rec['table'], {'table': rec['table'], 'indexes': [], 'before': 0.0, 'after': 0.0})
+                report[rec['table']]['before'] += self._time(conn, rec, repeat)
+
+            if not dry_run:
+                with conn:
+                    for rec in recs:
+                        collate = ' COLLATE NOCASE' if rec['nocase'] else ''
+                        conn.execute('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({}{})'.format(
+                            self.index_name(rec), rec['table'], rec['column'], collate))
+                        report[rec['table']]['indexes'].append(self.index_name(rec))
+                conn.execute('ANALYZE')
+
+            for rec in recs:
+                report[rec['table']]['after'] += self._time(conn, rec, repeat)
+        finally:
+            conn.close()
+        return list(report.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='根据工作负载为 train.db 创建索引')
+    parser.add_argument('--db', default='data/train.db')
+    parser.add_argument('--data', nargs='*', default=['data/train.jsonl'], help='WikiSQL JSONL 文件（与 train.db 对应的训练集）')
+    parser.add_argument('--query-log', default=Config.QUERY_LOG_PATH,
+                        help='QueryLog 记录的线上 SQL（包括轮转出的旧文件），默认 Config.QUERY_LOG_PATH')
+    parser.add_argument('--min-count', type=int, default=1)
+    parser.add_argument('--min-rows', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--dry-run', action='store_true', help='只输出建议和当前耗时，不创建索引')
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    advisor = IndexAdvisor(args.db)
+    for fname in args.data:
+        if not os.path.exists(fname):
+            logging.warning(f"Workload file {fname} does not exist, skipping.")
+            continue
+        logging.info(f"Mining workload from {fname}")
+        advisor.mine_dataset(fname)
+    for fname in query_log_files(args.query_log) if args.query_log else []:
+        logging.info(f"Mining online queries from {fname}")
+        advisor.mine_query_log(fname)
+
+    recs = advisor.recommend(min_count=args.min_count, min_rows=args.min_rows)
+    logging.info(f"Recommending {len(recs)} indexes.")
+    report = advisor.apply(recs, repeat=args.repeat, dry_run=args.dry_run)
+    rows = [
+        [r['table'], len(r['indexes']), '{:.1f}'.format(r['before'] * 1e6), '{:.1f}'.format(r['after'] * 1e6)]
+        for r in report
+    ]
+    print(tabulate(rows, headers=['table', 'indexes', 'before (us)', 'after (us)']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import logging
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+from app.utils.file_version import file_version
+
+
+TableSchema = namedtuple('TableSchema', ['name', 'columns', 'types', 'row_count'])
+
+
+def table_name(table_id):
+    if table_id.startswith('table'):
+        return table_id
+    return 'table_{}'.format(table_id.replace('-', '_'))
+
+
+class SchemaCatalog:
+    """train.db 的表结构目录：table_id -> 列名 / 列类型 / 行数
+
+    启动时加载一次；调用方在查表前调用 refresh_if_changed，数据库文件变化（mtime/大小）后重新加载。
+    """
+
+    def __init__(self, fdb):
+        self.fdb = fdb
+        self._tables = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        version = file_version(self.fdb)
+        tables = {}
+        if version is not None:
+            conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(self.fdb)), uri=True)
+            try:
+                names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+                for name in names:
+                    info = conn.execute("PRAGMA table_info('{}')".format(name)).fetchall()
+                    row_count = conn.execute('SELECT count(*) FROM "{}"'.format(name)).fetchone()[0]
+                    tables[name] = TableSchema(name, [r[1] for r in info], [r[2] for r in info], row_count)
+            finally:
+                conn.close()
+        else:
+            logging.warning(f"Database {self.fdb} does not exist, schema catalog is empty.")
+        with self._lock:
+            self._tables = tables
+            self._version = version
+        logging.info(f"Loaded schema catalog for {len(tables)} tables from {self.fdb}.")
+
+    def refresh(self):
+        self.load()
+
+    def refresh_if_changed(self):
+        """数据库文件的 mtime 或大小变化时重新加载，返回是否重新加载；并发调用时只有一个线程重新加载"""
+        if file_version(self.fdb) == self._version:
+            return False
+        with self._reload_lock:
+            if file_version(self.fdb) == self._version:
+                return False
+            self.load()
+            return True
+
+    def get(self, table_id):
+        return self._tables.get(table_name(table_id))
+
+    def headers(self, table_id):
+        """返回 {列序号: 列名}，表不存在时返回空字典"""
+        schema = self.get(table_id)
+        return dict(enumerate(schema.columns)) if schema else {}
+
+    def __contains__(self, table_id):
+        return table_name(table_id) in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(fdb):
+    """按数据库路径获取共享的 SchemaCatalog，首次访问时加载"""
+    key = os.path.abspath(fdb)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(key)
+            if catalog is None:
+                catalog = SchemaCatalog(key)
+                _catalogs[key] = catalog
+    return catalog
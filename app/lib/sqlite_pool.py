@@ -0,0 +1,127 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# 语句开头的空白与注释
+leading_re = re.compile(r'^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*', flags=re.DOTALL)
+query_re = re.compile(r'(?:SELECT|WITH)\b', flags=re.IGNORECASE)
+
+
+def is_query(sql):
+    """是否为以 SELECT（或 WITH）开头的查询语句；空语句和其他文本返回 False"""
+    if not isinstance(sql, str):
+        return False
+    return query_re.match(sql, leading_re.match(sql).end()) is not None
+
+
+class SQLitePool:
+    """只读 SQLite 连接池：每个线程一个长期连接，复用页缓存与预编译语句"""
+
+    def __init__(self, fdb, immutable=False, mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024,
+                 cached_statements=512):
+        self.fdb = os.path.abspath(fdb)
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._generation = 0
+
+    def _connect(self):
+        uri = 'file:{}?mode=ro'.format(self.fdb)
+        # immutable 模式跳过文件锁和变更检测，仅在数据库文件不会被修改时开启
+        if self.immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, cached_statements=self.cached_statements)
+        conn.execute('PRAGMA query_only = ON')
+        conn.execute('PRAGMA mmap_size = {}'.format(int(self.mmap_size)))
+        conn.execute('PRAGMA cache_size = -{}'.format(int(self.cache_size_kb)))
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def connection(self):
+        """返回当前线程的连接，不存在或已过期时重新打开"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def reset(self):
+        """数据库文件变化后调用，各线程下次使用时重新打开连接"""
+        self._generation += 1
+        logging.info(f"SQLite pool for {self.fdb} reset.")
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def execute_guarded(self, sql, params=(), timeout=None, max_rows=None, cancel_event=None, progress_ops=1000):
+        """
+        带执行保护的查询：超过 timeout 秒或 cancel_event 被置位时中断执行，最多返回 max_rows 行。
+        空语句和非 SELECT 语句不执行，直接返回 error。
+        返回 {"status": "ok" | "timed_out" | "cancelled" | "error", "rows", "truncated", "elapsed", "error"}
+        """
+        if not is_query(sql):
+            return {"status": "error", "rows": [], "truncated": False, "elapsed": 0.0,
+                    "error": "Only SELECT statements can be executed."}
+        conn = self.connection()
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        state = {"reason": None}
+
+        def check():
+            if cancel_event is not None and cancel_event.is_set():
+                state["reason"] = "cancelled"
+                return 1
+            if deadline is not None and time.monotonic() > deadline:
+                state["reason"] = "timed_out"
+                return 1
+            return 0
+
+        result = {"status": "ok", "rows": [], "truncated": False, "elapsed": 0.0, "error": None}
+        conn.set_progress_handler(check, progress_ops)
+        try:
+            cursor = conn.execute(sql, params)
+            if max_rows is None:
+                rows = cursor.fetchall()
+            else:
+                rows = cursor.fetchmany(max_rows + 1)
+                if len(rows) > max_rows:
+                    rows = rows[:max_rows]
+                    result["truncated"] = True
+            cursor.close()
+            result["rows"] = rows
+        except sqlite3.OperationalError as e:
+            result["status"] = state["reason"] or "error"
+            result["error"] = str(e)
+        except sqlite3.Error as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        finally:
+            conn.set_progress_handler(None, 0)
+            result["elapsed"] = time.monotonic() - start
+        return result
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(fdb, **kwargs):
+    """按数据库路径获取共享的连接池"""
+    key = os.path.abspath(fdb)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = SQLitePool(key, **kwargs)
+                _pools[key] = pool
+    return pool
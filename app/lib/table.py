@@ -22,6 +22,10 @@ class Table:
                 tabulate=tabulate(self.rows, headers=self.header)
                 )
 
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['id'], d['header'], d['types'], d['rows'], caption=d.get('caption'))
+
     @classmethod
     def get_schema(cls, db, table_id):
         table_infos = db.query('SELECT sql from sqlite_master WHERE tbl_name = :name', name=cls.get_id(table_id)).all()
@@ -35,15 +39,10 @@ class Table:
         return 'table_{}'.format(table_id.replace('-', '_'))
 
     @classmethod
-    def from_db(cls, db, table_id):
-        table_info = cls.get_schema(db, table_id)
-        if table_info:
-            schema_str = cls.schema_re.findall(table_info)[0] = [0].sql
-            header, types = [], []
-            for tup in schema_str.split(', '):
-                c, t = tup.split()
-                header.append(c)
-                types.append(t)
+    def from_db(cls, db, table_id, catalog):
+        table_schema = catalog.get(cls.get_id(table_id))
+        if table_schema:
+            header, types = list(table_schema.columns), list(table_schema.types)
             rows = [[getattr(r, h) for h in header] for r in db.query('SELECT * from {}'.format(cls.get_id(table_id)))]
             return cls(table_id, header, types, rows)
         else:
@@ -60,14 +59,36 @@ class Table:
                 db.query('DROP TABLE {}'.format(self.name))
             else:
                 return
-        type_str = ', '.join(['col{} {}'.format(i, t) for i, t in enumerate(self.types)])
-        db.query('CREATE TABLE {name} ({types})'.format(name=self.name, types=type_str))
-        for row in self.rows:
-            value_str = ', '.join([':val{}'.format(j) for j, c in enumerate(row)])
-            value_dict = {'val{}'.format(j): c for j, c in enumerate(row)}
-            if lower:
-                value_dict = {k: v.lower() if isinstance(v, str) else v for k, v in value_dict.items()}
-            db.query('INSERT INTO {name} VALUES ({values})'.format(name=self.name, values=value_str), **value_dict)
+        db.query('CREATE TABLE {name} ({types})'.format(name=self.name, types=self.type_str))
+        if not self.rows:
+            return
+        # 一次 executemany 插入所有行
+        value_str = ', '.join([':val{}'.format(j) for j in range(len(self.header))])
+        value_dicts = [{'val{}'.format(j): c for j, c in enumerate(row)} for row in self.lowered_rows(lower)]
+        db.bulk_query('INSERT INTO {name} VALUES ({values})'.format(name=self.name, values=value_str), value_dicts)
+
+    @property
+    def type_str(self):
+        return ', '.join(['col{} {}'.format(i, t) for i, t in enumerate(self.types)])
+
+    def lowered_rows(self, lower=True):
+        if not lower:
+            return self.rows
+        return [[c.lower() if isinstance(c, str) else c for c in row] for row in self.rows]
+
+    def bulk_create(self, conn, replace_existing=False, lower=True):
+        """使用 sqlite3 连接建表并 executemany 插入，事务由调用方管理"""
+        exists = conn.execute('SELECT 1 FROM sqlite_master WHERE tbl_name = ?', (self.name,)).fetchone()
+        if exists:
+            if replace_existing:
+                conn.execute('DROP TABLE {}'.format(self.name))
+            else:
+                return 0
+        conn.execute('CREATE TABLE {name} ({types})'.format(name=self.name, types=self.type_str))
+        value_str = ', '.join(['?'] * len(self.header))
+        conn.executemany('INSERT INTO {name} VALUES ({values})'.format(name=self.name, values=value_str),
+                         self.lowered_rows(lower))
+        return len(self.rows)
 
     def execute_query(self, db, query, lower=True):
         sel_str = 'col{}'.format(query.sel_index) if query.sel_index >= 0 else '*'
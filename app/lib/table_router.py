@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import math
+import os
+import pickle
+import re
+import sqlite3
+import time
+from collections import Counter
+
+import numpy as np
+
+from app.lib.schema_catalog import table_name
+from app.utils.file_version import file_version, load_versioned
+from app.utils.log_config import setup_logging
+
+
+token_re = re.compile(r'\w+', flags=re.UNICODE)
+column_re = re.compile(r'^col\d+$')
+
+
+def tokenize(text):
+    return token_re.findall(str(text).lower())
+
+
+class TableRouter:
+    """
+    train.db 的词法表路由：以表为文档、以表头和去重后的单元格值为词项的 BM25 倒排索引。
+
+    每个词项的 BM25 权重在构建时算好，查询只需把问题中各词项的权重数组累加到各表得分上。
+    """
+
+    def __init__(self, tables, postings, version=None):
+        self.tables = tables
+        self.postings = postings
+        self.version = version
+
+    @classmethod
+    def build(cls, fdb, tables_file=None, k1=1.2, b=0.75):
+        """
+        从 SQLite 数据库构建索引。train.db 的列名是 col0、col1……，
+        提供 WikiSQL tables.jsonl 时额外索引真实表头。
+        """
+        headers = {}
+        if tables_file:
+            with open(tables_file, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        d = json.loads(line)
+                        headers[table_name(d['id'])] = d['header']
+
+        version = file_version(fdb)
+        conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(fdb)), uri=True)
+        tables, docs = [], []
+        try:
+            names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for name in names:
+                values = set()
+                for row in conn.execute('SELECT * FROM "{}"'.format(name)):
+                    values.update(v for v in row if v is not None)
+                columns = [r[1] for r in conn.execute("PRAGMA table_info('{}')".format(name))]
+                terms = Counter()
+                for text in list(values) + [c for c in columns if not column_re.match(c)] + headers.get(name, []):
+                    terms.update(set(tokenize(text)))
+                tables.append(name)
+                docs.append(terms)
+        finally:
+            conn.close()
+
+        n_docs = len(docs)
+        avg_len = sum(sum(d.values()) for d in docs) / n_docs if n_docs else 0.0
+        df = Counter()
+        for terms in docs:
+            df.update(terms.keys())
+
+        lists = {}
+        for i, terms in enumerate(docs):
+            norm = k1 * (1 - b + b * sum(terms.values()) / avg_len) if avg_len else k1
+            for term, tf in terms.items():
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                ids, weights = lists.setdefault(term, ([], []))
+                ids.append(i)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+        postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(weights, dtype=np.float32))
+            for term, (ids, weights) in lists.items()
+        }
+        return cls(tables, postings, version)
+
+    def shortlist(self, question, k=10):
+        """返回得分最高的 k 张表 [(表名, 得分)]，问题中没有任何已知词项时返回空列表"""
+        hits = [self.postings[t] for t in set(tokenize(question)) if t in self.postings]
+        if not hits:
+            return []
+        scores = np.zeros(len(self.tables), dtype=np.float32)
+        for ids, weights in hits:
+            scores[ids] += weights
+        k = min(k, len(self.tables))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.tables[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'tables': self.tables, 'postings': self.postings, 'version': self.version}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        return cls(state['tables'], state['postings'], state['version'])
+
+
+def load_router(fdb, cache_path=None, tables_file=None):
+    """读取与数据库文件版本一致的缓存索引，没有或已过期时重新构建并保存"""
+    return load_versioned(
+        fdb, cache_path, TableRouter.load, lambda: TableRouter.build(fdb, tables_file=tables_file),
+        lambda: TableRouter([], {}), 'table router'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建 train.db 的词法表路由索引并测试查询')
+    parser.add_argument('--db', default='data/train.db')
+    parser.add_argument('--tables', default=None, help='WikiSQL tables.jsonl，用于索引真实表头')
+    parser.add_argument('--output', default='data/table_router.pkl')
+    parser.add_argument('--question', action='append', default=[], help='构建后查询的问题，可重复')
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    start = time.perf_counter()
+    router = TableRouter.build(args.db, tables_file=args.tables)
+    router.save(args.output)
+    logging.info(f"Indexed {len(router.tables)} tables / {len(router.postings)} terms "
+                 f"in {time.perf_counter() - start:.1f}s")
+    for question in args.question:
+        start = time.perf_counter()
+        shortlist = router.shortlist(question, args.k)
+        print(f"{question} ({(time.perf_counter() - start) * 1e6:.0f} us)")
+        for name, score in shortlist:
+            print(f"  {name}\t{score:.3f}")
+
+
+if __name__ == '__main__':
+    main()
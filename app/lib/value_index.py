@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from app.lib.query import re_whitespace
+from app.lib.schema_catalog import table_name
+from app.utils.file_version import file_version, load_versioned
+from app.utils.log_config import setup_logging
+
+
+token_re = re.compile(r'\w+|[^\w\s]', flags=re.UNICODE)
+
+
+def normalize(text):
+    """与 Query.from_sequence 比较列名的方式一致：小写并去掉所有空白"""
+    return re.sub(re_whitespace, '', str(text).lower())
+
+
+def cell_text(value):
+    """单元格值的文本形式；整数值的 REAL 去掉小数部分，与问题中的写法一致"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def key_hash(table, key):
+    digest = hashlib.blake2b('{}\x00{}'.format(table, key).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class ValueIndex:
+    """
+    train.db 每张表的单元格值词典：把问题中连续 token 组成的 n-gram（归一化后）映射到 (列, 值)。
+
+    所有表的 (表, 归一化值) 哈希存放在一个有序 uint64 数组中，原始值按 UTF-8 存放在一段连续的字节中，
+    一个问题的全部 n-gram 用一次 searchsorted 查找，命中后再比较归一化值排除哈希碰撞。
+    """
+
+    def __init__(self, hashes, columns, offsets, blob, version=None):
+        self.hashes = hashes
+        self.columns = columns
+        self.offsets = offsets
+        self.blob = blob
+        self.version = version
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def build(cls, fdb, max_value_len=100):
+        version = file_version(fdb)
+        conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(fdb)), uri=True)
+        entries = []
+        try:
+            names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for name in names:
+                seen = set()
+                for row in conn.execute('SELECT * FROM "{}"'.format(name)):
+                    for col, value in enumerate(row):
+                        if value is None:
+                            continue
+                        text = cell_text(value)
+                        key = normalize(text)
+                        if not key or len(text) > max_value_len or (col, key) in seen:
+                            continue
+                        seen.add((col, key))
+                        entries.append((key_hash(name, key), col, text))
+        finally:
+            conn.close()
+
+        entries.sort(key=lambda e: e[0])
+        hashes = np.fromiter((e[0] for e in entries), dtype=np.uint64, count=len(entries))
+        columns = np.fromiter((e[1] for e in entries), dtype=np.int16, count=len(entries))
+        values = [e[2].encode('utf-8') for e in entries]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(v) for v in values])
+        return cls(hashes, columns, offsets, b''.join(values), version)
+
+    def value(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def lookup(self, table_id, question, max_tokens=8):
+        """
+        返回问题中出现的单元格值 [(列, 值, 起始字符, 结束字符)]：
+        优先取最长的匹配，同一段文本只对应一组结果（可能来自多列）。
+        """
+        if not len(self.hashes):
+            return []
+        name = table_name(table_id)
+        tokens = [(m.group().lower(), m.start(), m.end()) for m in token_re.finditer(question)]
+        grams = []
+        for i in range(len(tokens)):
+            key = ''
+            for j in range(i, min(i + max_tokens, len(tokens))):
+                key += tokens[j][0]
+                grams.append((i, j + 1, key))
+        if not grams:
+            return []
+
+        hashes = np.fromiter((key_hash(name, key) for _, _, key in grams), dtype=np.uint64, count=len(grams))
+        left = np.searchsorted(self.hashes, hashes, side='left')
+        right = np.searchsorted(self.hashes, hashes, side='right')
+
+        found = []
+        for (start, end, key), lo, hi in zip(grams, left, right):
+            for k in range(lo, hi):
+                value = self.value(k)
+                if normalize(value) == key:
+                    found.append((end - start, start, end, int(self.columns[k]), value))
+
+        matches, spans, used = [], set(), set()
+        for _, start, end, col, value in sorted(found, key=lambda f: (-f[0], f[1])):
+            # 同一段文本可以对应多列，与已选文本部分重叠的较短匹配丢弃
+            if (start, end) not in spans and used.intersection(range(start, end)):
+                continue
+            spans.add((start, end))
+            used.update(range(start, end))
+            matches.append((col, value, start, end))
+        return [(col, value, tokens[start][1], tokens[end - 1][2]) for col, value, start, end in matches]
+
+    def contains(self, table_id, column, value):
+        """表中该列是否有与 value 归一化后相同的单元格值"""
+        key = normalize(value)
+        if not key or not len(self.hashes):
+            return False
+        h = np.uint64(key_hash(table_name(table_id), key))
+        lo = np.searchsorted(self.hashes, h, side='left')
+        hi = np.searchsorted(self.hashes, h, side='right')
+        return any(int(self.columns[k]) == column and normalize(self.value(k)) == key for k in range(lo, hi))
+
+    def resolve_conditions(self, table_id, question, conds):
+        """
+        为示例 SQL 中的等值条件在问题里查找同一列的单元格值。
+        返回与 conds 等长的列表，找到时为单元格值，否则为 None。
+        """
+        by_column = {}
+        for col, value, _, _ in self.lookup(table_id, question):
+            by_column.setdefault(col, value)
+        return [by_column.get(col) if op == 0 else None for col, op, _ in conds]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, hashes=self.hashes, columns=self.columns, offsets=self.offsets,
+                 blob=np.frombuffer(self.blob, dtype=np.uint8),
+                 version=np.array(self.version or (0, 0), dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = tuple(int(v) for v in data['version'])
+            return cls(data['hashes'], data['columns'], data['offsets'], data['blob'].tobytes(), version)
+
+
+def load_value_index(fdb, cache_path=None):
+    """读取与数据库文件版本一致的缓存词典，没有或已过期时重新构建并保存"""
+    return load_versioned(
+        fdb, cache_path, ValueIndex.load, lambda: ValueIndex.build(fdb),
+        lambda: ValueIndex(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int16), np.zeros(1, dtype=np.int64), b''),
+        'value index'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建 train.db 的单元格值词典并测试查询')
+    parser.add_argument('--db', default='data/train.db')
+    parser.add_argument('--output', default='data/value_index.npz')
+    parser.add_argument('--table', required=True, help='查询的 table_id')
+    parser.add_argument('--question', action='append', default=[], help='构建后查询的问题，可重复')
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    start = time.perf_counter()
+    index = ValueIndex.build(args.db)
+    index.save(args.output)
+    logging.info(f"Indexed {len(index)} cell values in {time.perf_counter() - start:.1f}s")
+    for question in args.question:
+        start = time.perf_counter()
+        matches = index.lookup(args.table, question)
+        print(f"{question} ({(time.perf_counter() - start) * 1e6:.0f} us)")
+        for col, value, _, _ in matches:
+            print(f"  col{col} = {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+
+from app.models.registry import get_embedding_service
+from app.models.rag_model import (
+    OLLAMA_API_URL, PINECONE_INDEX_NAME, TOP_K, OllamaError, answer_cache, build_llama_prompt, build_result,
+    cache_answer, clean_sql_query, error_result, example_from_match, extract_sql_from_ollama_response,
+    retrieve_top_k, route_match, run_query, try_fast_path
+)
+from app.utils.llm_scheduler import LLMQueueFull, PRIORITY_INTERACTIVE, scheduler
+from app.utils.pinecone_client import init_pinecone, query_pinecone
+from app.utils.tracing import stage
+from app.utils.log_config import payload, sampled, setup_logging
+from config import Config
+
+#################################
+# generate_response 的 asyncio 版本：
+#   向量库（Pinecone REST）与 Ollama 通过 httpx 异步请求，等待期间不占用线程；
+#   编码与 SQLite 等阻塞操作放到固定大小的线程池中执行；
+#   LLM 并发与 Flask 接口共用 llm_scheduler.scheduler 的槽位和优先级。
+# 由 app.asgi 提供 HTTP 接口。
+#################################
+PINECONE_API_VERSION = "2024-07"
+
+# 编码提交、表头查询与 SQL 执行使用的线程池
+executor = ThreadPoolExecutor(max_workers=Config.ASYNC_EXECUTOR_WORKERS, thread_name_prefix="async-rag")
+
+# 等待 LLM 槽位的线程池：排队中的请求各占一个线程，不与上面的线程池争用
+llm_slot_executor = ThreadPoolExecutor(
+    max_workers=Config.LLM_MAX_INFLIGHT + Config.LLM_MAX_QUEUE, thread_name_prefix="async-llm-slot"
+)
+
+_http_client: Optional[httpx.AsyncClient] = None
+_index_hosts = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """当前事件循环共用的 HTTP 客户端（连接复用）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=Config.ASYNC_HTTP_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+    return _http_client
+
+
+async def close():
+    """关闭 HTTP 客户端（ASGI 应用退出时调用）"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+#################################
+# 异步调用
+#################################
+async def encode_async(question: str):
+    """经共享的 EmbeddingService 编码问题，等待批处理结果时不占用线程"""
+    with stage("encode"):
+        future = await run_blocking(get_embedding_service().submit, question)
+        return await asyncio.wrap_future(future)
+
+
+async def get_index_host(index_name: str) -> str:
+    host = _index_hosts.get(index_name)
+    if host is None:
+        description = await run_blocking(init_pinecone().describe_index, index_name)
+        host = _index_hosts[index_name] = description.host
+    return host
+
+
+async def query_vectors_async(vector, index_name: str, top_k: int = TOP_K) -> Optional[dict]:
+    """查询向量库；本地后端在线程池中执行，Pinecone 直接调用 REST 接口"""
+    with stage("retrieve") as span:
+        if Config.VECTOR_BACKEND == "local":
+            results = await run_blocking(query_pinecone, init_pinecone(), index_name, vector, top_k)
+            if results is None:
+                span.error = "no_results"
+            return results
+        try:
+            host = await get_index_host(index_name)
+            response = await get_http_client().post(
+                f"https://{host}/query",
+                json={"vector": vector, "topK": top_k, "includeMetadata": True},
+                headers={"Api-Key": Config.PINECONE_API_KEY, "X-Pinecone-API-Version": PINECONE_API_VERSION},
+                timeout=Config.ASYNC_VECTOR_TIMEOUT,
+            )
+            response.raise_for_status()
+            results = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            span.error = e
+            logging.error("Error querying Pinecone index %s: %s", index_name, e)
+            _index_hosts.pop(index_name, None)
+            return None
+        if not results.get("matches"):
+            return None
+        return results
+
+
+async def generate_response_with_ollama_async(prompt: str, model: str = "llama3.2") -> str:
+    """经共享的 LLMScheduler 调用 Ollama；排队已满时抛出 LLMQueueFull，Ollama 出错时抛出 OllamaError"""
+    if sampled("ollama_prompt"):
+        logging.info("Sending async request to Ollama server with prompt: %s", payload(prompt))
+    try:
+        with stage("llm") as span:
+            async with scheduler.async_slot(PRIORITY_INTERACTIVE, executor=llm_slot_executor):
+                response = await get_http_client().post(
+                    OLLAMA_API_URL, json={"model": model, "prompt": prompt}, timeout=60
+                )
+            if response.status_code != 200:
+                span.error = response.status_code
+    except httpx.HTTPError as e:
+        logging.error("Error calling Ollama: %s", e)
+        raise OllamaError(f"Error calling Ollama: {e}") from e
+    if response.status_code != 200:
+        logging.error("Ollama server error - status code %s: %s", response.status_code, payload(response.text))
+        raise OllamaError(f"Ollama server error - status code {response.status_code}")
+    return response.text
+
+
+#################################
+# 核心函数
+#################################
+async def generate_response_async(question: str, index_name: Optional[str] = None) -> dict:
+    """与 rag_model.generate_response 相同的流程与返回值"""
+    if index_name is None:
+        index_name = PINECONE_INDEX_NAME
+    try:
+        question_vector = await encode_async(question)
+
+        cached = answer_cache.lookup(question_vector)
+        if cached is not None:
+            if sampled("answer_cache_hit"):
+                logging.info("Answer cache hit (similarity %.3f)", cached['similarity'])
+            return dict(cached, cached=True, path="cache")
+
+        results = await query_vectors_async(question_vector.tolist(), index_name, retrieve_top_k(question))
+        if not results:
+            logging.warning("No matches found in Pinecone query results.")
+            return {"sql": "", "answer": "No relevant data found in the database."}
+        best_match = results["matches"][0]
+        if len(results["matches"]) > 1:
+            best_match = await run_blocking(route_match, question, results["matches"])
+        example = await run_blocking(example_from_match, best_match, question)
+        if not example["headers"]:
+            return {"sql": "", "answer": "Table metadata not found."}
+
+        fast_result = await run_blocking(try_fast_path, question, example)
+        if fast_result is not None:
+            cache_answer(question_vector, fast_result)
+            return fast_result
+
+        ollama_response = await generate_response_with_ollama_async(
+            build_llama_prompt(question, example["initial_sql"])
+        )
+        cleaned_sql = clean_sql_query(extract_sql_from_ollama_response(ollama_response))
+
+        result = build_result(cleaned_sql, await run_blocking(run_query, cleaned_sql), "llm")
+        cache_answer(question_vector, result)
+        return result
+    except LLMQueueFull as e:
+        logging.warning("Rejected question, LLM is busy: %s", e)
+        return error_result(e)
+    except OllamaError as e:
+        return error_result(e)
+    except Exception as e:
+        logging.error("Unexpected error in generate_response_async: %s", e)
+        return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
+
+
+if __name__ == "__main__":
+    setup_logging()
+    print(json.dumps(asyncio.run(generate_response_async("Tell me what the notes are for South Australia")),
+                     ensure_ascii=False))
@@ -0,0 +1,353 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tabulate import tabulate
+
+from app.lib.dbengine import DBEngine
+from app.lib.query import Query
+from app.lib.schema_catalog import table_name
+from app.models.fast_path import build_template_sql
+from app.models.registry import EMBEDDING_MODEL_NAME
+from app.utils import tracing
+from app.utils.data_loader import iter_jsonl
+from app.utils.log_config import setup_logging
+from config import Config, BASE_DIR
+
+#################################
+# 离线基准测试：把 WikiSQL 数据集中的问题逐条送入 generate_response，
+# 统计各阶段（encode / retrieve / schema / llm / clean / execute）的 p50/p95/p99、吞吐量，
+# 并与 DBEngine.execute_query 对标准 Query 的执行结果比较，得到执行准确率。
+#
+# WikiSQL 各划分的表互不重叠，问题与检索示例都必须来自 --db 中的表：
+# 默认用 --data 中表在 --db 里的全部样本构建本地索引，检索时去掉问题本身（留一法）。
+#
+# 向量库与 LLM 可替换为本地实现：
+#   --vector-store local     进程内索引（由 --data 或 --index-file 构建，增量更新）
+#   --llm oracle             返回标准 SQL，用于检查检索、清理与执行环节的损失
+#   --llm echo               原样返回检索示例的初始 SQL
+#   --llm ollama             调用真实的 Ollama 服务
+#
+#   python -m app.models.benchmark --data data/train.jsonl --limit 1000 --llm oracle
+#################################
+STAGES = ("encode", "retrieve", "route", "schema", "values", "llm", "clean", "execute")
+PERCENTILES = (50, 95, 99)
+
+question_re = re.compile(r"^Question: (.*)$", flags=re.MULTILINE)
+initial_sql_re = re.compile(r"^Initial SQL: (.*)$", flags=re.MULTILINE)
+
+
+class StandInResponse:
+    status_code = 200
+
+    def __init__(self, sql):
+        self.text = json.dumps({"response": sql}) + "\n" + json.dumps({"done": True}) + "\n"
+
+
+class StandInLLM:
+    """代替 Ollama 的本地会话，实现 generate_response_with_ollama 用到的 post 接口"""
+
+    def __init__(self, mode, gold_sql=None, latency=0.0):
+        self.mode = mode
+        self.gold_sql = gold_sql or {}
+        self.latency = latency
+
+    def post(self, url, json=None, **kwargs):
+        prompt = json["prompt"]
+        if self.mode == "oracle":
+            match = question_re.search(prompt)
+            sql = self.gold_sql.get(match.group(1) if match else "", "")
+        else:
+            match = initial_sql_re.search(prompt)
+            sql = match.group(1) if match else ""
+        if self.latency:
+            time.sleep(self.latency)
+        return StandInResponse(sql)
+
+
+class LeaveOneOut:
+    """包装 query_pinecone：去掉与当前问题相同的示例，多取一个候选补足 top_k"""
+
+    def __init__(self, query):
+        self.query = query
+        self.current = threading.local()
+
+    def __call__(self, pinecone_client, index_name, vector, top_k=1):
+        results = self.query(pinecone_client, index_name, vector, top_k=top_k + 1)
+        if not results:
+            return results
+        own = getattr(self.current, "case", None)
+        matches = [
+            m for m in results["matches"]
+            if own is None or (m.get("metadata", {}).get("question"), m.get("metadata", {}).get("table_id")) != own
+        ][:top_k]
+        return {"matches": matches} if matches else None
+
+
+class StageRecorder:
+    """收集 tracing.stage 上报的各阶段耗时"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, name, seconds, error):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if error is not None:
+                self.errors[name] += 1
+
+
+def summarize(seconds):
+    """耗时列表的分位数（毫秒）"""
+    if not seconds:
+        return {"count": 0}
+    values = np.asarray(seconds) * 1000.0
+    summary = {"count": len(values), "mean_ms": float(values.mean())}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = float(np.percentile(values, p))
+    return summary
+
+
+def normalize_value(value):
+    if isinstance(value, (int, float)):
+        return round(float(value), 6)
+    text = str(value).strip().lower()
+    try:
+        return round(float(text), 6)
+    except ValueError:
+        return text
+
+
+def answers_match(rows, gold):
+    """预测结果（行列表）与标准结果（单列值列表）是否一致，不考虑顺序"""
+    if not isinstance(rows, list):
+        return False
+    predicted = [normalize_value(row[0]) for row in rows if row]
+    return Counter(predicted) == Counter(normalize_value(v) for v in gold)
+
+
+def db_tables(fdb):
+    conn = sqlite3.connect("file:{}?mode=ro".format(os.path.abspath(fdb)), uri=True)
+    try:
+        return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+
+
+def write_examples(data_file, tables, path):
+    """把表在数据库中的样本写入 path，作为本地索引的示例文件；返回 (写入数, 跳过数)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    written = skipped = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in iter_jsonl(data_file):
+            if table_name(record["table_id"]) not in tables:
+                skipped += 1
+                continue
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    return written, skipped
+
+
+def load_cases(data_file, fdb, limit=None, tables=None):
+    """读取数据集并用 DBEngine 执行标准 Query；返回 (可评测的样本, 跳过数)"""
+    engine = DBEngine(fdb)
+    cases, skipped = [], 0
+    for record in iter_jsonl(data_file):
+        if limit and len(cases) >= limit:
+            break
+        if tables is not None and table_name(record["table_id"]) not in tables:
+            skipped += 1
+            continue
+        try:
+            gold = engine.execute_query(record["table_id"], Query.from_dict(record["sql"]), lower=True)
+        except Exception as e:
+            logging.debug(f"Skipping {record['table_id']}: {e}")
+            skipped += 1
+            continue
+        cases.append({
+            "question": record["question"],
+            "table_id": record["table_id"],
+            "gold": gold,
+            "gold_sql": build_template_sql(record["table_id"], record["sql"], record["sql"]["conds"]) or "",
+        })
+    return cases, skipped
+
+
+def configure(args):
+    """在导入 rag_model 之前设置向量库与数据库（它们在模块导入或首次使用时读取 Config）"""
+    if os.path.abspath(args.db) != Config.TRAIN_DATABASE_PATH:
+        # 其他数据库的表路由索引不写入共享缓存文件
+        Config.TABLE_ROUTER_PATH = None
+        Config.VALUE_INDEX_PATH = None
+    Config.TRAIN_DATABASE_PATH = os.path.abspath(args.db)
+    Config.TABLE_ROUTER_ENABLED = not args.no_table_router
+    Config.VALUE_INDEX_ENABLED = not args.no_value_index
+    Config.QUERY_LOG_PATH = None
+    if args.vector_store == "local":
+        Config.VECTOR_BACKEND = "local"
+        Config.LOCAL_INDEX_DIR = args.index_dir
+    if not args.answer_cache:
+        Config.ANSWER_CACHE_SIZE = 0
+    if args.fast_path_threshold is not None:
+        Config.FAST_PATH_SCORE_THRESHOLD = args.fast_path_threshold
+
+
+def prepare_index(args, tables):
+    """构建本地索引并确认示例的表都在 --db 中；不可用时以非零状态退出"""
+    if args.vector_store != "local":
+        return
+    if args.index_file:
+        examples, missing = 0, 0
+        for record in iter_jsonl(args.index_file):
+            if table_name(record["table_id"]) in tables:
+                examples += 1
+            else:
+                missing += 1
+        if not examples:
+            raise SystemExit(f"None of the tables in {args.index_file} are in {args.db}; every retrieved example "
+                             f"would miss its table. Use --index-file from the same split as --db.")
+        if missing:
+            logging.warning(f"{missing} of {examples + missing} examples in {args.index_file} "
+                            f"reference tables that are not in {args.db}")
+        index_file = args.index_file
+    else:
+        index_file = os.path.join(args.index_dir, "examples.jsonl")
+        examples, _ = write_examples(args.data, tables, index_file)
+    logging.info(f"Indexing {examples} examples from {index_file}")
+
+    from app.models.embedding import index_dataset
+    index_dataset(index_file, args.index_name, EMBEDDING_MODEL_NAME)
+
+
+def run_benchmark(args):
+    configure(args)
+    tables = db_tables(Config.TRAIN_DATABASE_PATH)
+    cases, skipped = load_cases(args.data, Config.TRAIN_DATABASE_PATH, args.limit, tables)
+    logging.info(f"Loaded {len(cases)} cases from {args.data} ({skipped} skipped, table not in {args.db})")
+    if not cases:
+        raise SystemExit(f"No usable cases: none of the questions in {args.data} have their table in {args.db}.")
+    prepare_index(args, tables)
+
+    from app.models import rag_model
+    from app.utils.llm_scheduler import scheduler
+    if args.llm != "ollama":
+        scheduler.session = StandInLLM(args.llm, {c["question"]: c["gold_sql"] for c in cases}, args.llm_latency)
+    leave_one_out = LeaveOneOut(rag_model.query_pinecone)
+    rag_model.query_pinecone = leave_one_out
+
+    recorder = StageRecorder()
+    latencies = [0.0] * len(cases)
+    outcomes = [None] * len(cases)
+
+    def run_case(i):
+        case = cases[i]
+        leave_one_out.current.case = (case["question"], case["table_id"])
+        start = time.perf_counter()
+        result = rag_model.generate_response(case["question"], possible_answer="", index_name=args.index_name)
+        latencies[i] = time.perf_counter() - start
+        correct = result.get("status") == "ok" and answers_match(result["answer"], case["gold"])
+        outcomes[i] = {"path": result.get("path") or "none", "status": result.get("status") or "error",
+                       "correct": correct}
+
+    tracing.add_listener(recorder)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(run_case, range(len(cases))))
+    finally:
+        tracing.remove_listener(recorder)
+    wall_time = time.perf_counter() - start
+
+    n_correct = sum(o["correct"] for o in outcomes)
+    return {
+        "config": {
+            "data": args.data, "db": args.db, "limit": args.limit, "vector_store": args.vector_store,
+            "llm": args.llm, "concurrency": args.concurrency, "answer_cache": args.answer_cache,
+            "fast_path_threshold": Config.FAST_PATH_SCORE_THRESHOLD, "table_router": Config.TABLE_ROUTER_ENABLED,
+            "value_index": Config.VALUE_INDEX_ENABLED,
+            "embedding_backend": Config.EMBEDDING_BACKEND, "index_name": args.index_name,
+        },
+        "cases": len(cases),
+        "skipped": skipped,
+        "wall_time_s": wall_time,
+        "throughput_qps": len(cases) / wall_time if wall_time else 0.0,
+        "execution_accuracy": n_correct / len(cases) if cases else 0.0,
+        "correct": n_correct,
+        "paths": dict(Counter(o["path"] for o in outcomes)),
+        "statuses": dict(Counter(o["status"] for o in outcomes)),
+        "latency": summarize(latencies),
+        "stages": {name: dict(summarize(recorder.samples.get(name, [])), errors=recorder.errors[name])
+                   for name in STAGES},
+    }
+
+
+def print_report(report, baseline=None):
+    def fmt(section, key):
+        value = section.get(key)
+        return "" if value is None else "{:.2f}".format(value)
+
+    rows = []
+    for name, section in [("total", report["latency"])] + list(report["stages"].items()):
+        row = [name, section["count"]] + [fmt(section, f"p{p}_ms") for p in PERCENTILES]
+        if baseline:
+            base = baseline["latency"] if name == "total" else baseline["stages"].get(name, {})
+            row += ["" if base.get("p50_ms") is None or section.get("p50_ms") is None
+                    else "{:+.2f}".format(section["p50_ms"] - base["p50_ms"])]
+        rows.append(row)
+    headers = ["stage", "count"] + [f"p{p} (ms)" for p in PERCENTILES] + (["Δp50 (ms)"] if baseline else [])
+    print(tabulate(rows, headers=headers))
+    print(f"\nthroughput: {report['throughput_qps']:.1f} questions/s over {report['cases']} cases")
+    accuracy = f"execution accuracy: {report['execution_accuracy']:.4f}"
+    if baseline:
+        accuracy += f" ({report['execution_accuracy'] - baseline['execution_accuracy']:+.4f} vs baseline)"
+    print(accuracy)
+    print(f"paths: {report['paths']}, statuses: {report['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放数据集，统计各阶段耗时与执行准确率")
+    parser.add_argument("--data", default="data/train.jsonl", help="回放的 WikiSQL 问题文件，表须在 --db 中")
+    parser.add_argument("--db", default=Config.TRAIN_DATABASE_PATH, help="问题对应表所在的 SQLite 数据库")
+    parser.add_argument("--limit", type=int, default=1000, help="最多回放的问题数，0 表示全部")
+    parser.add_argument("--vector-store", choices=("local", "pinecone"), default="local")
+    parser.add_argument("--index-file", default=None,
+                        help="构建本地索引的示例文件；默认使用 --data 中表在 --db 里的全部样本（留一法）")
+    parser.add_argument("--index-dir", default=os.path.join(BASE_DIR, "data", "benchmark_index"))
+    parser.add_argument("--index-name", default="text-to-sql-index")
+    parser.add_argument("--llm", choices=("oracle", "echo", "ollama"), default="oracle")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="本地 LLM 每次调用模拟的耗时（秒）")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时处理的问题数")
+    parser.add_argument("--answer-cache", action="store_true", help="启用语义答案缓存")
+    parser.add_argument("--no-table-router", action="store_true", help="只使用向量检索的第一名选择表")
+    parser.add_argument("--no-value-index", action="store_true", help="不使用单元格值词典填充条件值")
+    parser.add_argument("--fast-path-threshold", type=float, default=None,
+                        help="覆盖 FAST_PATH_SCORE_THRESHOLD，大于 1 时所有问题都经过 LLM")
+    parser.add_argument("--output", default="data/benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="之前保存的结果文件，输出与之对比的差值")
+    args = parser.parse_args()
+
+    setup_logging(logging.WARNING)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_report(report, baseline)
+    print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
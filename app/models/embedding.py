@@ -1,64 +1,185 @@
-import os
+import argparse
 import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
-from app.utils.pinecone_client import init_pinecone, create_or_connect_index, upsert_vectors
+from app.utils.pinecone_client import (
+    init_pinecone, create_or_connect_index, upsert_vectors, delete_vectors, get_index
+)
+from app.utils.data_loader import iter_jsonl, batched
+from app.utils.index_manifest import IndexManifest, default_manifest_path, record_id
+from app.utils.log_config import setup_logging
+from config import Config
 
 # 配置
 DATA_FILE = "../../data/train.jsonl"
 INDEX_NAME = "text-to-sql-index"
 MODEL_NAME = "all-MiniLM-L6-v2"
+BATCH_SIZE = 512  # 每次读取、编码并上传的记录数
+ENCODE_BATCH_SIZE = 32  # model.encode 内部的 batch_size
+
+#################################
+# 编码工作进程：每个进程只加载一次模型
+#################################
+_worker_model = None
 
-def load_jsonl(file_path):
-    """加载 JSONL 数据"""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return [json.loads(line) for line in f]
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
 
-def generate_embeddings(questions, model_name):
+def _encode_in_worker(questions, encode_batch_size):
+    return _worker_model.encode(questions, batch_size=encode_batch_size)
+
+def generate_embeddings(questions, model, encode_batch_size=ENCODE_BATCH_SIZE):
     """生成问题的嵌入"""
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(questions, show_progress_bar=True, batch_size=32)
-    return embeddings
+    return model.encode(questions, batch_size=encode_batch_size)
+
+def build_vector(vector_id, data, embedding):
+    """构造上传到向量库的向量结构"""
+    # 提取问题、SQL和table_id并构造metadata
+    metadata = {
+        "question": data["question"],
+        "sql": json.dumps(data["sql"]),  # 将嵌套 JSON 数据转换为字符串
+        "table_id": data.get("table_id", "unknown_table")  # 包含 table_id 信息
+    }
+    return {"id": vector_id, "values": embedding.tolist(), "metadata": metadata}
+
+#################################
+# 索引流水线
+#################################
+class IndexPipeline:
+    """编码与上传重叠执行：多个进程并行编码，多个线程并行上传，在途批次数有上限"""
+
+    def __init__(self, pc, index_name, manifest, run, encoder, encode_fn, encode_workers, upload_threads,
+                 encode_batch_size):
+        self.pc = pc
+        self.index_name = index_name
+        self.manifest = manifest
+        self.run = run
+        self.encoder = encoder
+        self.encode_fn = encode_fn
+        self.encode_batch_size = encode_batch_size
+        self.uploader = ThreadPoolExecutor(max_workers=upload_threads, thread_name_prefix="upsert")
+        self.max_encoding = encode_workers * 2
+        self.max_uploading = upload_threads * 2
+        self.encoding = deque()
+        self.uploading = deque()
+        self.connected = False
+        self.uploaded = 0
+
+    def submit(self, records, new_ids):
+        questions = [records[i]["question"] for i in new_ids]
+        future = self.encoder.submit(self.encode_fn, questions, self.encode_batch_size)
+        self.encoding.append((records, new_ids, future))
+        self._drain_encoding(self.max_encoding)
+
+    def _drain_encoding(self, limit):
+        while len(self.encoding) > limit or (self.encoding and self.encoding[0][2].done()):
+            records, new_ids, future = self.encoding.popleft()
+            embeddings = future.result()
+            if not self.connected:
+                create_or_connect_index(self.pc, self.index_name, dimension=len(embeddings[0]))
+                print(f"Connected to Pinecone index: {self.index_name}")
+                self.connected = True
+            vectors = [build_vector(i, records[i], e) for i, e in zip(new_ids, embeddings)]
+            self.uploading.append((new_ids, self.uploader.submit(upsert_vectors, self.pc, self.index_name, vectors)))
+            self._drain_uploading(self.max_uploading)
+
+    def _drain_uploading(self, limit):
+        while len(self.uploading) > limit or (self.uploading and self.uploading[0][1].done()):
+            new_ids, future = self.uploading.popleft()
+            future.result()
+            # 上传成功后才写入清单，崩溃后从这里继续
+            self.manifest.commit_batch(new_ids, self.run)
+            self.uploaded += len(new_ids)
 
-def upsert_to_pinecone(index_name, dataset, embeddings):
-    """将嵌入和元数据上传到 Pinecone"""
+    def flush(self):
+        self._drain_encoding(0)
+        self._drain_uploading(0)
+
+    def close(self):
+        self.uploader.shutdown(wait=True)
+
+def index_dataset(file_path, index_name, model_name, batch_size=BATCH_SIZE, manifest_path=None,
+                  workers=1, upload_threads=2, encode_batch_size=ENCODE_BATCH_SIZE):
+    """
+    增量、可续传地构建索引：读取 → 分批 → 编码 → 上传，内存中只保留有限个批次。
+    向量 ID 由内容哈希生成，清单中已有的记录直接跳过；数据中已不存在的记录在结束时删除。
+    workers > 1 时在多个进程中并行编码，同时由 upload_threads 个线程上传。
+    """
     pc = init_pinecone()
-    index = create_or_connect_index(pc, index_name, dimension=len(embeddings[0]))
-    print(f"Connected to Pinecone index: {index_name}")
-
-    vectors = []
-    for i, data in enumerate(dataset):
-        # 提取问题、SQL和table_id并构造metadata
-        metadata = {
-            "question": data["question"],
-            "sql": json.dumps(data["sql"]),  # 将嵌套 JSON 数据转换为字符串
-            "table_id": data.get("table_id", "unknown_table")  # 包含 table_id 信息
-        }
-        # 创建向量结构
-        vectors.append({"id": f"query_{i}", "values": embeddings[i], "metadata": metadata})
-
-        # 打印上传进度
-        if i % 10 == 0:
-            print(f"Processed {i + 1}/{len(dataset)} records")
-
-    print("Upserting vectors to Pinecone...")
-    upsert_vectors(pc, index_name, vectors)
-    print(f"Upserted {len(vectors)} vectors to Pinecone index: {index_name}")
+    manifest = IndexManifest(manifest_path or default_manifest_path(index_name), index_name)
+    run = manifest.start_run()
+
+    if workers > 1:
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        encoder = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name, threads))
+        encode_fn = _encode_in_worker
+    else:
+        model = SentenceTransformer(model_name)
+        encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        encode_fn = lambda questions, size: generate_embeddings(questions, model, size)
+    pipeline = IndexPipeline(pc, index_name, manifest, run, encoder, encode_fn, max(workers, 1), upload_threads,
+                             encode_batch_size)
+
+    seen = 0
+    start = time.perf_counter()
+    try:
+        for batch in batched(iter_jsonl(file_path), batch_size):
+            records = {record_id(data): data for data in batch}
+            known = manifest.known(records)
+            manifest.mark_seen(known, run)
+            seen += len(batch)
+
+            new_ids = [i for i in records if i not in known]
+            if new_ids:
+                pipeline.submit(records, new_ids)
+            elapsed = time.perf_counter() - start
+            print(f"Scanned {seen} records ({seen / elapsed:.1f} records/s), "
+                  f"uploaded {pipeline.uploaded} ({pipeline.uploaded / elapsed:.1f} records/s)")
+        pipeline.flush()
+
+        stale = manifest.stale(run)
+        if stale:
+            delete_vectors(pc, index_name, stale)
+            manifest.remove(stale)
+            print(f"Deleted {len(stale)} stale vectors.")
+        if Config.VECTOR_BACKEND == "local":
+            removed = get_index(pc, index_name).compact(Config.LOCAL_INDEX_COMPACT_RATIO)
+            if removed:
+                print(f"Compacted local index, reclaimed {removed} rows.")
+        manifest.finish_run(run)
+    finally:
+        pipeline.close()
+        encoder.shutdown(wait=True)
+        manifest.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Uploaded {pipeline.uploaded} records in {elapsed:.1f}s ({pipeline.uploaded / elapsed:.1f} records/s)")
+    return pipeline.uploaded
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为问题数据集构建向量索引")
+    parser.add_argument("--data", default=DATA_FILE)
+    parser.add_argument("--index", default=INDEX_NAME)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--workers", type=int, default=1, help="并行编码的进程数")
+    parser.add_argument("--upload-threads", type=int, default=2, help="并行上传的线程数")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批读取并上传的记录数")
+    parser.add_argument("--encode-batch-size", type=int, default=ENCODE_BATCH_SIZE, help="model.encode 的 batch_size")
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
     try:
-        # 加载数据
-        print(f"Loading records from {DATA_FILE}...")
-        dataset = load_jsonl(DATA_FILE)
-        print(f"Loaded {len(dataset)} records.")
-
-        # 生成嵌入
-        print(f"Generating embeddings using model: {MODEL_NAME}")
-        questions = [record["question"] for record in dataset]
-        embeddings = generate_embeddings(questions, MODEL_NAME)
-
-        # 上传到 Pinecone
-        print("Initializing Pinecone...")
-        upsert_to_pinecone(INDEX_NAME, dataset, embeddings)
-        print("Data upload completed successfully.")
+        print(f"Indexing records from {args.data} using model: {args.model}")
+        uploaded = index_dataset(args.data, args.index, args.model, batch_size=args.batch_size,
+                                 workers=args.workers, upload_threads=args.upload_threads,
+                                 encode_batch_size=args.encode_batch_size)
+        print(f"Data upload completed successfully: {uploaded} new records.")
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -1,32 +1,26 @@
 import logging
 import json
-import requests
-from sentence_transformers import SentenceTransformer
+from app.models.registry import get_embedding_service
 from typing import Optional
 from app.utils.pinecone_client import init_pinecone, query_pinecone
+from app.utils.llm_scheduler import scheduler, LLMQueueFull, PRIORITY_INTERACTIVE
+from config import Config
 from app.lib.query import Query
+from app.lib.schema_catalog import get_catalog
+from app.utils.tracing import stage
+from app.utils.log_config import payload, sampled, setup_logging
 
 #################################
 # 配置区域
 #################################
-LOG_LEVEL = logging.INFO
 OLLAMA_API_URL = "http://127.0.0.1:11434/api/generate"
 TEXT_TO_SQL_INDEX_NAME = "text-to-sql-index"
 TABLE_TO_SQL_INDEX_NAME = "table-to-sql-index"
 TOP_K = 1  # 查询 Pinecone 返回的匹配数目
 
-# 日志配置
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
 #################################
-# 初始化向量模型
+# 向量模型通过注册表按需加载（见 app.models.registry）
 #################################
-logging.info("Initializing embedding model...")
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-logging.info("Embedding model loaded.")
 
 #################################
 # 工具函数：从表头补全 SQL 列名
@@ -64,46 +58,66 @@ def build_real_sql(q: Query, table_metadata: dict) -> str:
 #################################
 # 查询表元数据
 #################################
-def query_table_pinecone(table_id: str) -> Optional[dict]:
+# table_id → WikiSQL 原始表头，每张表只查询一次 table-to-sql-index
+_table_headers = {}
+
+def query_table_headers(table_id: str) -> Optional[list]:
     """
-    从 Pinecone 的 table-to-sql-index 中获取指定 table_id 的列头信息和行数据。
+    从 Pinecone 的 table-to-sql-index 中获取 WikiSQL 原始表头。
+    train.db 的列名只有 col0、col1……，不包含列的含义。
     """
-    try:
-        pc = init_pinecone()
-        query_vector = embedding_model.encode(table_id).tolist()
-        results = query_pinecone(pc, TABLE_TO_SQL_INDEX_NAME, query_vector, top_k=TOP_K)
-
-        if not results or not results.get("matches"):
-            logging.error(f"No matches found for table_id: {table_id} in table-to-sql-index.")
-            return None
-
-        # 解析查询结果
-        for match in results["matches"]:
+    headers = _table_headers.get(table_id)
+    if headers is None:
+        query_vector = get_embedding_service().encode(table_id).tolist()
+        results = query_pinecone(init_pinecone(), TABLE_TO_SQL_INDEX_NAME, query_vector, top_k=TOP_K)
+        for match in (results["matches"] if results else []):
             metadata = match.get("metadata", {})
             if metadata.get("table_id") == table_id:
-                headers = metadata.get("headers", [])
-                return {"table_id": table_id, "headers": headers}
+                headers = _table_headers[table_id] = metadata.get("headers", [])
+                break
+    return headers
 
-        logging.error(f"No headers found for table_id: {table_id}")
-        return None
+def query_table_metadata(table_id: str) -> Optional[dict]:
+    """
+    从共享的表结构目录确认表存在并取得表名，从 table-to-sql-index 取得原始列头；
+    没有原始列头时退回目录中的 col0、col1……。
+    """
+    try:
+        catalog = get_catalog(Config.TRAIN_DATABASE_PATH)
+        catalog.refresh_if_changed()
+        schema = catalog.get(table_id)
+        if schema is None:
+            logging.error("Table %s is not in %s", table_id, Config.TRAIN_DATABASE_PATH)
+            return None
+        headers = query_table_headers(table_id)
+        if not headers:
+            logging.warning(
+                "No headers found for table_id %s in %s, using column names", table_id, TABLE_TO_SQL_INDEX_NAME
+            )
+            headers = schema.columns
+        return {"table_id": schema.name, "headers": headers}
     except Exception as e:
-        logging.error(f"Error fetching table metadata from Pinecone for table_id {table_id}: {e}")
+        logging.error("Error fetching table metadata for table_id %s: %s", table_id, e)
         return None
 
 #################################
 # 调用 Ollama 服务
 #################################
-def generate_response_with_ollama(prompt: str, model: str = "llama3.2") -> str:
+def generate_response_with_ollama(prompt: str, model: str = "llama3.2", priority: int = PRIORITY_INTERACTIVE) -> str:
     try:
-        logging.info(f"Sending request to Ollama server with prompt: {prompt}")
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={"model": model, "prompt": prompt},
-            timeout=60
-        )
+        if sampled("ollama_prompt"):
+            logging.info("Sending request to Ollama server with prompt: %s", payload(prompt))
+        with stage("llm") as span, scheduler.slot(priority) as ticket:
+            response = ticket.session.post(
+                OLLAMA_API_URL,
+                json={"model": model, "prompt": prompt},
+                timeout=60
+            )
+            if response.status_code != 200:
+                span.error = response.status_code
 
         if response.status_code != 200:
-            logging.error(f"Ollama server error - status code {response.status_code}")
+            logging.error("Ollama server error - status code %s", response.status_code)
             return f"Ollama server error: {response.text}"
 
         results = []
@@ -112,15 +126,18 @@ def generate_response_with_ollama(prompt: str, model: str = "llama3.2") -> str:
                 line_data = json.loads(line)
                 results.append(line_data.get("response", ""))
             except json.JSONDecodeError as e:
-                logging.warning(f"Failed to parse line: {line} - Error: {e}")
+                logging.warning("Failed to parse line: %s - Error: %s", line, e)
                 continue
 
         final_response = "".join(results).strip()
-        logging.info(f"Received response from Ollama server: {final_response}")
+        if sampled("ollama_response"):
+            logging.info("Received response from Ollama server: %s", payload(final_response))
         return final_response
 
+    except LLMQueueFull:
+        raise
     except Exception as e:
-        logging.error(f"Unexpected error while communicating with Ollama: {e}")
+        logging.error("Unexpected error while communicating with Ollama: %s", e)
         return "An unexpected error occurred while communicating with Ollama."
 
 #################################
@@ -130,7 +147,8 @@ def query_database(sql_query: str) -> str:
     """
     模拟数据库查询，实际代码需替换为对应数据库查询代码。
     """
-    logging.info(f"Executing SQL: {sql_query}")
+    if sampled("execute_sql"):
+        logging.info("Executing SQL: %s", payload(sql_query))
     # TODO: 替换为实际数据库查询逻辑
     return f"Query executed: {sql_query}"
 
@@ -141,58 +159,71 @@ def generate_response(question: str, possible_answer: str) -> dict:
     """
     RAG 查询的完整流程：
     1. 从 text-to-sql-index 获取最匹配的问题。
-    2. 根据 table_id 从 table-to-sql-index 获取表的元数据。
+    2. 根据 table_id 从表结构目录确认表存在，并从 table-to-sql-index 获取原始表头。
     3. 构建 SQL 查询语句。
     4. 调用 Ollama 修正 SQL。
     5. 查询数据库获取最终答案。
     """
-    try:
-        # 查询问题对应的 Pinecone 数据
-        pc = init_pinecone()
-        query_vector = embedding_model.encode(question).tolist()
-        results = query_pinecone(pc, TEXT_TO_SQL_INDEX_NAME, query_vector, top_k=TOP_K)
-
-        if not results or not results.get("matches"):
-            logging.warning("No matches found in Pinecone query results.")
-            return {"sql": "", "answer": "No relevant data found in the database."}
-
-        # 获取问题的最佳匹配
-        best_match = results["matches"][0]
-        table_id = best_match["metadata"].get("table_id", "unknown_table")
-        logging.info(f"Processing table_id: {table_id}")
-
-        # 查询表的元数据
-        table_metadata = query_table_pinecone(table_id)
-        if not table_metadata:
-            return {"sql": "", "answer": f"Table {table_id} does not exist or has no metadata."}
-
-        # 构建 SQL 查询语句
-        query_data = json.loads(best_match["metadata"]["sql"])
-        real_sql = build_real_sql(Query.from_dict(query_data), table_metadata)
-
-        # 调用 Ollama 修正 SQL
-        llama_prompt = (
-            f"Question: {question}\n"
-            f"Initial SQL: {real_sql}\n"
-            f"Possible Answer: {possible_answer}\n"
-            "Instruction: Modify the SQL query to ensure it aligns with the question and database structure. "
-            "Return only the final SQL query."
-        )
-        final_sql = generate_response_with_ollama(llama_prompt)
-
-        # 查询数据库获取答案
-        actual_answer = query_database(final_sql)
-
-        return {"sql": final_sql, "answer": actual_answer}
-
-    except Exception as e:
-        logging.error(f"Unexpected error in generate_response: {e}")
-        return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
+    with stage("embedding2.generate_response") as span:
+        try:
+            # 查询问题对应的 Pinecone 数据
+            with stage("encode"):
+                query_vector = get_embedding_service().encode(question).tolist()
+            with stage("retrieve") as retrieve_span:
+                results = query_pinecone(init_pinecone(), TEXT_TO_SQL_INDEX_NAME, query_vector, top_k=TOP_K)
+                if results is None:
+                    retrieve_span.error = "no_results"
+
+            if not results or not results.get("matches"):
+                logging.warning("No matches found in Pinecone query results.")
+                return {"sql": "", "answer": "No relevant data found in the database."}
+
+            # 获取问题的最佳匹配
+            best_match = results["matches"][0]
+            table_id = best_match["metadata"].get("table_id", "unknown_table")
+            if sampled("table_id"):
+                logging.info("Processing table_id: %s", table_id)
+
+            # 查询表的元数据
+            with stage("schema"):
+                table_metadata = query_table_metadata(table_id)
+            if not table_metadata:
+                return {"sql": "", "answer": f"Table {table_id} does not exist or has no metadata."}
+
+            # 构建 SQL 查询语句
+            query_data = json.loads(best_match["metadata"]["sql"])
+            real_sql = build_real_sql(Query.from_dict(query_data), table_metadata)
+
+            # 调用 Ollama 修正 SQL
+            llama_prompt = (
+                f"Question: {question}\n"
+                f"Initial SQL: {real_sql}\n"
+                f"Possible Answer: {possible_answer}\n"
+                "Instruction: Modify the SQL query to ensure it aligns with the question and database structure. "
+                "Return only the final SQL query."
+            )
+            final_sql = generate_response_with_ollama(llama_prompt)
+
+            # 查询数据库获取答案
+            with stage("execute"):
+                actual_answer = query_database(final_sql)
+
+            return {"sql": final_sql, "answer": actual_answer}
+
+        except LLMQueueFull as e:
+            span.error = e
+            logging.warning("Rejected question, LLM is busy: %s", e)
+            return {"sql": "", "answer": "The server is busy, please try again later.", "busy": True}
+        except Exception as e:
+            span.error = e
+            logging.error("Unexpected error in generate_response: %s", e)
+            return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
 
 #################################
 # 示例调用
 #################################
 if __name__ == "__main__":
+    setup_logging()
     question = "Tell me what the notes are for South Australia"
     possible_answer = ""
     response = generate_response(question, possible_answer)
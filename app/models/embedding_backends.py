@@ -0,0 +1,96 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.utils.data_loader import iter_jsonl
+from app.utils.log_config import setup_logging
+from app.utils.vector_math import normalize_rows
+from config import Config
+
+#################################
+# 句向量模型的 CPU 推理后端
+#   torch: 原始 fp32 PyTorch 模型
+#   int8:  对 Linear 层做 PyTorch 动态 int8 量化
+#   onnx:  ONNX Runtime 推理（可选择量化后的 ONNX 文件）
+# 所有后端都返回 SentenceTransformer 对象，encode 接口不变。
+#################################
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def load_embedding_model(model_name: str, backend: str = "torch"):
+    """按后端加载句向量模型"""
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        model_kwargs = {"file_name": Config.EMBEDDING_ONNX_FILE} if Config.EMBEDDING_ONNX_FILE else None
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {BACKENDS})")
+
+
+def _timed_encode(model, questions, batch_size):
+    start = time.perf_counter()
+    vectors = model.encode(questions, batch_size=batch_size)
+    return normalize_rows(vectors), len(questions) / (time.perf_counter() - start)
+
+
+def recall_check(model_name: str, backend: str, data_file: str, corpus_size: int = 5000, n_queries: int = 500,
+                 k: int = 10, batch_size: int = 32) -> dict:
+    """
+    用 fp32 向量作为基准评估后端的召回损失。
+    语料向量用 fp32 编码（与线上索引一致），查询分别用 fp32 和待测后端编码，
+    比较两者在语料中的 top-k 近邻（排除自身）的重合比例。
+    """
+    questions = []
+    for record in iter_jsonl(data_file):
+        questions.append(record["question"])
+        if len(questions) >= corpus_size:
+            break
+    queries = questions[:n_queries]
+
+    reference = load_embedding_model(model_name, "torch")
+    corpus, _ = _timed_encode(reference, questions, batch_size)
+    ref_queries, ref_speed = _timed_encode(reference, queries, batch_size)
+    candidate = load_embedding_model(model_name, backend)
+    cand_queries, cand_speed = _timed_encode(candidate, queries, batch_size)
+
+    def neighbours(query_vectors):
+        scores = query_vectors @ corpus.T
+        scores[np.arange(len(query_vectors)), np.arange(len(query_vectors))] = -np.inf
+        return np.argsort(-scores, axis=1)[:, :k]
+
+    ref_nn, cand_nn = neighbours(ref_queries), neighbours(cand_queries)
+    recall_at_k = np.mean([len(set(r) & set(c)) / k for r, c in zip(ref_nn, cand_nn)])
+    return {
+        "backend": backend,
+        "queries": len(queries),
+        "corpus": len(questions),
+        "recall@1": float(np.mean(ref_nn[:, 0] == cand_nn[:, 0])),
+        f"recall@{k}": float(recall_at_k),
+        "mean_cosine_to_fp32": float(np.mean(np.sum(ref_queries * cand_queries, axis=1))),
+        "fp32_questions_per_sec": ref_speed,
+        "backend_questions_per_sec": cand_speed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比量化/ONNX 后端与 fp32 模型的召回与速度")
+    parser.add_argument("--backend", choices=BACKENDS, default=Config.EMBEDDING_BACKEND)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--data", default="data/dev.jsonl")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    report = recall_check(args.model, args.backend, args.data, corpus_size=args.corpus_size,
+                          n_queries=args.queries, k=args.k)
+    for key, value in report.items():
+        print(f"{key}: {value}")
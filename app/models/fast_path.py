@@ -0,0 +1,108 @@
+import re
+from difflib import SequenceMatcher
+from typing import Optional
+
+from app.lib.query import Query
+from app.lib.schema_catalog import table_name
+
+token_re = re.compile(r'\w+|[^\w\s]', flags=re.UNICODE)
+
+
+#################################
+# 模板快速路径：检索到的示例足够相似时，
+# 直接把新问题中的条件值代入示例 SQL，跳过 LLM
+#################################
+def tokenize(text: str):
+    """切分为 (小写 token, 起始位置, 结束位置) 列表"""
+    return [(m.group().lower(), m.start(), m.end()) for m in token_re.finditer(text)]
+
+def find_span(tokens, value_tokens):
+    """在 token 序列中查找值的位置，返回 [start, end) 或 None"""
+    n = len(value_tokens)
+    words = [t[0] for t in tokens]
+    for i in range(len(words) - n + 1):
+        if words[i:i + n] == value_tokens:
+            return i, i + n
+    return None
+
+def _map_position(opcodes, pos, is_end):
+    """
+    把示例问题中的 token 边界映射到新问题中，无法确定时返回 None。
+    紧贴边界外侧新插入的 token 归入值内，例如 South Australia → New South Wales 中的 New。
+    """
+    for k, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == "insert":
+            if not is_end and i1 == pos:
+                return j1
+            continue
+        if not is_end and i1 <= pos < i2:
+            if tag == "equal":
+                return j1 + (pos - i1)
+            return j1 if pos == i1 else None
+        if is_end and i1 < pos <= i2:
+            if pos < i2:
+                return j1 + (pos - i1) if tag == "equal" else None
+            if k + 1 < len(opcodes) and opcodes[k + 1][0] == "insert":
+                return opcodes[k + 1][4]
+            return j2
+    return None
+
+def substitute_values(new_question: str, example_question: str, conds) -> Optional[list]:
+    """
+    对齐示例问题与新问题，把示例条件值在新问题中对应位置的文本作为新的条件值。
+    任一条件值无法对齐时返回 None。
+    """
+    old_tokens = tokenize(example_question)
+    new_tokens = tokenize(new_question)
+    opcodes = SequenceMatcher(
+        a=[t[0] for t in old_tokens], b=[t[0] for t in new_tokens], autojunk=False
+    ).get_opcodes()
+
+    new_conds = []
+    for col, op, value in conds:
+        span = find_span(old_tokens, [t[0] for t in tokenize(str(value))])
+        if span is None:
+            return None
+        start = _map_position(opcodes, span[0], is_end=False)
+        end = _map_position(opcodes, span[1], is_end=True)
+        if start is None or end is None or end <= start:
+            return None
+        new_conds.append([col, op, new_question[new_tokens[start][1]:new_tokens[end - 1][2]]])
+    return new_conds
+
+def numeric_value(value) -> Optional[float]:
+    """条件值的数值形式（允许千位分隔符），不是数字时返回 None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().replace(",", ""))
+    except ValueError:
+        return None
+
+def build_template_sql(table_id: str, raw_sql: dict, conds) -> Optional[str]:
+    """
+    按 WikiSQL 的 sel/agg/conds 构造可直接执行的 SQL：等值比较不区分大小写，
+    大于/小于只接受数值，值不是数字时返回 None。
+    """
+    select = f"col{raw_sql['sel']}"
+    agg = Query.agg_ops[raw_sql.get("agg", 0)]
+    if agg:
+        select = f"{agg}({select})"
+
+    where_clauses = []
+    for col, op, value in conds:
+        if op >= len(Query.cond_ops) - 1:
+            return None
+        if op == 0:
+            escaped_val = str(value).replace("'", "''")
+            where_clauses.append(f"col{col} = '{escaped_val}' COLLATE NOCASE")
+            continue
+        number = numeric_value(value)
+        if number is None:
+            return None
+        where_clauses.append(f"col{col} {Query.cond_ops[op]} {number!r}")
+
+    sql = f"SELECT {select} FROM {table_name(table_id)}"
+    if where_clauses:
+        sql += " WHERE " + " AND ".join(where_clauses)
+    return sql + ";"
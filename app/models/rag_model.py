@@ -1,31 +1,51 @@
 import json
 import logging
-import sqlite3
+import re
+import threading
 import requests
-import os
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from app.models.registry import get_embedding_service, get_table_router, get_value_index
 from app.utils.pinecone_client import init_pinecone, query_pinecone
+from app.utils.answer_cache import AnswerCache
+from app.utils.llm_scheduler import scheduler, LLMQueueFull, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from app.models.fast_path import substitute_values, build_template_sql
+from app.lib.query import Query
+from app.lib.schema_catalog import get_catalog, table_name
+from app.lib.sqlite_pool import get_pool
+from app.utils.query_log import QueryLog
+from app.utils.tracing import stage
+from app.utils.log_config import payload, sampled, setup_logging
+from config import Config
 from typing import Optional
 
 #################################
 # 配置区域
 #################################
-LOG_LEVEL = logging.INFO
 OLLAMA_API_URL = "http://127.0.0.1:11434/api/generate"
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_PATH = os.path.join(BASE_DIR, "../../data/train.db")
+DATABASE_PATH = Config.TRAIN_DATABASE_PATH
 PINECONE_INDEX_NAME = "text-to-sql-index"
 TOP_K = 1
 
-# 日志配置
-logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
+select_re = re.compile(r"\bSELECT\b", flags=re.IGNORECASE)
 
 #################################
-# 初始化向量模型
+# 向量模型通过注册表按需加载（见 app.models.registry）
 #################################
-logging.info("Initializing embedding model...")
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-logging.info("Embedding model loaded.")
+
+# 记录线上执行的 SQL，供索引建议器分析
+query_log = QueryLog(
+    Config.QUERY_LOG_PATH, max_bytes=Config.QUERY_LOG_MAX_BYTES, backup_count=Config.QUERY_LOG_BACKUPS,
+    sample_every=Config.QUERY_LOG_SAMPLE_EVERY
+) if Config.QUERY_LOG_PATH else None
+
+# 流式接口执行 SQL 的线程池
+sql_executor = ThreadPoolExecutor(max_workers=Config.SQL_EXECUTOR_WORKERS, thread_name_prefix="sql")
+
+# 语义答案缓存（train.db 变化时自动失效）
+answer_cache = AnswerCache(
+    threshold=Config.ANSWER_CACHE_THRESHOLD, ttl=Config.ANSWER_CACHE_TTL,
+    max_entries=Config.ANSWER_CACHE_SIZE, db_path=DATABASE_PATH
+)
 
 #################################
 # 工具函数
@@ -41,11 +61,12 @@ def extract_sql_from_ollama_response(response_text: str) -> str:
                     sql_parts.append(json_obj["response"])
             except json.JSONDecodeError:
                 continue
-        final_sql = "".join(sql_parts).strip()
-        logging.info(f"Extracted SQL from Ollama: {final_sql}")
+        final_sql = extract_statement("".join(sql_parts))
+        if sampled("ollama_response"):
+            logging.info("Extracted SQL from Ollama: %s", payload(final_sql))
         return final_sql
     except Exception as e:
-        logging.error(f"Error extracting SQL: {e}")
+        logging.error("Error extracting SQL: %s", e)
         return "An error occurred while processing Ollama response."
 
 def clean_sql_query(sql: str) -> str:
@@ -59,122 +80,528 @@ def clean_sql_query(sql: str) -> str:
             condition = condition.replace(" = ' ", "='").replace(" ' ", "'").replace(" '", "'").strip()
             sql = f"{parts[0].strip()} WHERE {condition}"
     sql = " ".join(sql.split())
-    logging.info(f"Cleaned SQL query: {sql}")
+    if sampled("cleaned_sql"):
+        logging.info("Cleaned SQL query: %s", payload(sql))
     return sql
 
 def get_table_headers(table_id: str) -> dict:
-    """从数据库中获取表的列名"""
-    table_name = f"table_{table_id.replace('-', '_')}"
+    """从共享的表结构目录中获取表的列名 {列序号: 列名}"""
     try:
-        logging.info(f"Fetching headers for table: {table_name}")
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute(f"PRAGMA table_info('{table_name}')")
-        headers = {row[0]: row[1] for row in cursor.fetchall()}
-        conn.close()
-        return headers
+        catalog = get_catalog(DATABASE_PATH)
+        # 数据库文件更新后重新加载目录，并丢弃指向旧文件的连接
+        if catalog.refresh_if_changed():
+            get_db_pool().reset()
+        return catalog.headers(table_id)
     except Exception as e:
-        logging.error(f"Error fetching table headers for {table_id}: {e}")
+        logging.error("Error fetching table headers for %s: %s", table_id, e)
         return {}
 
+def get_db_pool():
+    return get_pool(
+        DATABASE_PATH, immutable=Config.SQLITE_IMMUTABLE, mmap_size=Config.SQLITE_MMAP_SIZE,
+        cache_size_kb=Config.SQLITE_CACHE_SIZE_KB, cached_statements=Config.SQLITE_CACHED_STATEMENTS
+    )
+
+LLM_UNAVAILABLE_MESSAGE = "The language model is unavailable, please try again later."
+
+QUERY_STATUS_MESSAGES = {
+    "timed_out": "The query took too long and was stopped.",
+    "cancelled": "The query was cancelled.",
+    "error": "An error occurred while querying the database.",
+}
+
+def run_query(sql_query: str, cancel_event: Optional[threading.Event] = None) -> dict:
+    """带超时、行数上限和取消的 SQL 执行，返回结构化结果（见 SQLitePool.execute_guarded）"""
+    if sampled("execute_sql"):
+        logging.info("Executing SQL: %s", payload(sql_query))
+    with stage("execute") as span:
+        try:
+            result = get_db_pool().execute_guarded(
+                sql_query, timeout=Config.SQL_TIMEOUT, max_rows=Config.SQL_MAX_ROWS, cancel_event=cancel_event
+            )
+        except Exception as e:
+            result = {"status": "error", "rows": [], "truncated": False, "elapsed": 0.0, "error": str(e)}
+        if result["status"] != "ok":
+            span.error = result["status"]
+    if result["status"] != "ok":
+        logging.warning("SQL execution %s after %.3fs: %s", result['status'], result['elapsed'], result['error'])
+    elif query_log is not None:
+        query_log.record(sql_query)
+    if result["truncated"]:
+        logging.info("SQL result truncated to %s rows.", Config.SQL_MAX_ROWS)
+    return result
+
 def query_database(sql_query: str) -> str:
-    """执行 SQL 查询并返回结果"""
-    try:
-        logging.info(f"Executing SQL: {sql_query}")
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        conn.close()
-        return rows
-    except Exception as e:
-        logging.error(f"Error querying database: {e}")
-        return "An error occurred while querying the database."
+    """执行 SQL 查询并返回结果行，失败时返回错误说明"""
+    result = run_query(sql_query)
+    if result["status"] == "ok":
+        return result["rows"]
+    return QUERY_STATUS_MESSAGES[result["status"]]
+
+def build_result(sql: str, query_result: dict, path: str) -> dict:
+    """把执行结果整理为接口返回的字典"""
+    ok = query_result["status"] == "ok"
+    return {
+        "sql": sql,
+        "answer": query_result["rows"] if ok else QUERY_STATUS_MESSAGES[query_result["status"]],
+        "path": path,
+        "status": query_result["status"],
+        "truncated": query_result["truncated"],
+    }
+
+def cache_answer(question_vector, result: dict) -> None:
+    """只缓存真正执行了 SQL 语句并成功的结果"""
+    if result.get("status") == "ok" and result.get("sql"):
+        answer_cache.store(question_vector, result)
 
 #################################
 # Ollama 调用
 #################################
-def generate_response_with_ollama(prompt: str, model: str = "llama3.2") -> str:
+class OllamaError(RuntimeError):
+    """Ollama 无法访问或返回非 200 状态码"""
+
+def generate_response_with_ollama(prompt: str, model: str = "llama3.2", priority: int = PRIORITY_INTERACTIVE) -> str:
+    """经调度器调用 Ollama；排队已满时抛出 LLMQueueFull，Ollama 出错时抛出 OllamaError"""
     try:
-        logging.info(f"Sending request to Ollama server with prompt: {prompt}")
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={"model": model, "prompt": prompt},
-            timeout=60
-        )
-        if response.status_code != 200:
-            logging.error(f"Ollama server error - status code {response.status_code}")
-            return f"Ollama server error: {response.text}"
-        return response.text
+        if sampled("ollama_prompt"):
+            logging.info("Sending request to Ollama server with prompt: %s", payload(prompt))
+        with stage("llm") as span, scheduler.slot(priority) as ticket:
+            response = ticket.session.post(
+                OLLAMA_API_URL,
+                json={"model": model, "prompt": prompt},
+                timeout=60
+            )
+            if response.status_code != 200:
+                span.error = response.status_code
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error calling Ollama: {e}")
-        return "An error occurred while calling Ollama."
+        logging.error("Error calling Ollama: %s", e)
+        raise OllamaError(f"Error calling Ollama: {e}") from e
+    if response.status_code != 200:
+        logging.error("Ollama server error - status code %s: %s", response.status_code, payload(response.text))
+        raise OllamaError(f"Ollama server error - status code {response.status_code}")
+    return response.text
+
+def find_statement_start(text: str) -> int:
+    """返回第一个 SELECT 关键字的位置，没有时返回 -1"""
+    match = select_re.search(text)
+    return match.start() if match else -1
+
+def find_statement_end(text: str) -> int:
+    """
+    返回第一条完整 SQL 语句结尾分号的位置，尚未结束时返回 -1。
+    引号从第一个 SELECT 开始计算，前面说明文字中的撇号（如 Here's）不影响判断。
+    """
+    start = find_statement_start(text)
+    if start < 0:
+        return -1
+    in_quote = False
+    for i in range(start, len(text)):
+        if text[i] == "'":
+            in_quote = not in_quote
+        elif text[i] == ";" and not in_quote:
+            return i
+    return -1
+
+def extract_statement(text: str) -> str:
+    """去掉 SQL 前后的说明文字和代码块标记，只保留第一条语句；找不到 SELECT 时原样返回"""
+    start = find_statement_start(text)
+    if start < 0:
+        return text.strip()
+    end = find_statement_end(text)
+    if end >= 0:
+        return text[start:end + 1]
+    return text[start:].split("```")[0].strip()
+
+def stream_sql_from_ollama(prompt: str, model: str = "llama3.2", priority: int = PRIORITY_INTERACTIVE):
+    """流式读取 Ollama 输出，逐段产出累计文本；一旦得到完整 SQL 就断开连接停止生成"""
+    if sampled("ollama_prompt"):
+        logging.info("Streaming request to Ollama server with prompt: %s", payload(prompt))
+    with scheduler.slot(priority) as ticket:
+        try:
+            response = ticket.session.post(
+                OLLAMA_API_URL,
+                json={"model": model, "prompt": prompt, "stream": True},
+                timeout=60,
+                stream=True
+            )
+        except requests.exceptions.RequestException as e:
+            logging.error("Error calling Ollama: %s", e)
+            raise OllamaError(f"Error calling Ollama: {e}") from e
+        try:
+            if response.status_code != 200:
+                logging.error("Ollama server error - status code %s", response.status_code)
+                raise OllamaError(f"Ollama server error - status code {response.status_code}")
+            text = ""
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                text += chunk.get("response", "")
+                yield text
+                if chunk.get("done") or find_statement_end(text) >= 0:
+                    break
+        finally:
+            # 关闭连接后 Ollama 会停止继续生成
+            response.close()
 
 #################################
 # 核心函数
 #################################
+def build_initial_sql(table_id: str, raw_sql: dict, headers: dict) -> str:
+    """根据检索到的示例 SQL 结构和表头构造初始 SQL"""
+    col_sel = headers.get(raw_sql["sel"], f"col{raw_sql['sel']}")
+    col_conds = [
+        f"{headers.get(cond[0], f'col{cond[0]}')} {['=', '>', '<'][cond[1]]} '{cond[2]}'"
+        for cond in raw_sql["conds"]
+    ]
+    return f"SELECT {col_sel} FROM table_{table_id.replace('-', '_')} WHERE {' AND '.join(col_conds)};"
+
+def build_llama_prompt(question: str, initial_sql: str) -> str:
+    return (
+        f"Question: {question}\n"
+        f"Initial SQL: {initial_sql}\n"
+        f"Instruction: Modify the SQL query to ensure the following:\n"
+        f"- The SQL syntax is valid and correct.\n"
+        f"- Do not change the table name or column names unless necessary.\n"
+        f"- Ensure all text comparisons (e.g., WHERE, AND, OR conditions) include 'COLLATE NOCASE' immediately after the value or column being compared to handle case-insensitivity.\n"
+        f"- For example: col_name = 'value' COLLATE NOCASE or 'value' COLLATE NOCASE = col_name.\n"
+        f"- Do not apply 'COLLATE NOCASE' to numerical or non-string comparisons.\n"
+        f"- Ensure that the SQL is optimized and matches the structure of the database.\n"
+        f"Return only the final SQL query."
+    )
+
+def retrieve_top_k(question: Optional[str]) -> int:
+    """启用表路由时多取几个候选供其挑选"""
+    return Config.TABLE_ROUTER_CANDIDATES if question and Config.TABLE_ROUTER_ENABLED else TOP_K
+
+def route_match(question: str, matches: list) -> dict:
+    """用词法表路由确认或重排向量检索结果：返回第一个表在路由名单中的候选，都不在时保留向量第一名"""
+    with stage("route"):
+        shortlist = {name for name, _ in get_table_router().shortlist(question, Config.TABLE_ROUTER_SHORTLIST)}
+    for rank, match in enumerate(matches):
+        if table_name(match.get("metadata", {}).get("table_id", "")) in shortlist:
+            if rank > 0 and sampled("table_router_rerank"):
+                logging.info("Table router promoted vector candidate %s (%s)", rank, match['metadata']['table_id'])
+            return match
+    return matches[0]
+
+def retrieve_example(question_vector, index_name: str, question: Optional[str] = None) -> Optional[dict]:
+    """检索最相似的示例问题，返回其表、SQL 结构和初始 SQL；提供 question 时由表路由确认候选"""
+    with stage("retrieve") as span:
+        results = query_pinecone(init_pinecone(), index_name, question_vector.tolist(), top_k=retrieve_top_k(question))
+        if results is None:
+            span.error = "no_results"
+    if not results or not results.get("matches"):
+        logging.warning("No matches found in Pinecone query results.")
+        return None
+
+    matches = results["matches"]
+    if len(matches) > 1:
+        return example_from_match(route_match(question, matches), question)
+    return example_from_match(matches[0], question)
+
+def resolve_values(table_id: str, question: Optional[str], conds: list) -> list:
+    """用单元格值词典为示例的等值条件找到问题中提到的值，找不到的位置为 None"""
+    if not question or not Config.VALUE_INDEX_ENABLED or not conds:
+        return [None] * len(conds)
+    with stage("values"):
+        return get_value_index().resolve_conditions(table_id, question, conds)
+
+def example_from_match(best_match, question: Optional[str] = None) -> dict:
+    """
+    把检索结果中的最佳匹配整理为示例：问题、表、SQL 结构、表头和初始 SQL。
+    提供 question 时，初始 SQL 的等值条件使用问题中出现的单元格值（value_conds）。
+    """
+    metadata = best_match.get("metadata", {})
+    table_id = metadata.get("table_id", "")
+    raw_sql = json.loads(metadata.get("sql", "{}"))
+    with stage("schema"):
+        headers = get_table_headers(table_id)
+    example = {
+        "question": metadata.get("question", ""),
+        "score": best_match.get("score"),
+        "table_id": table_id,
+        "raw_sql": raw_sql,
+        "headers": headers,
+        "value_conds": [None] * len(raw_sql.get("conds", [])),
+        "initial_sql": "",
+    }
+    if headers:
+        example["value_conds"] = resolve_values(table_id, question, raw_sql.get("conds", []))
+        conds = [
+            [col, op, value if resolved is None else resolved]
+            for (col, op, value), resolved in zip(raw_sql.get("conds", []), example["value_conds"])
+        ]
+        example["initial_sql"] = build_initial_sql(table_id, dict(raw_sql, conds=conds), headers)
+        if sampled("initial_sql"):
+            logging.info("Initial SQL: %s", payload(example['initial_sql']))
+    return example
+
+def value_exists(table_id: str, column: int, value) -> bool:
+    """等值条件的值是否出现在该列中；有单元格值词典时查词典，否则查数据库"""
+    if Config.VALUE_INDEX_ENABLED:
+        return get_value_index().contains(table_id, column, value)
+    rows = get_db_pool().execute(
+        f"SELECT 1 FROM {table_name(table_id)} WHERE col{int(column)} = ? COLLATE NOCASE LIMIT 1", (str(value),)
+    )
+    return bool(rows)
+
+def try_fast_path(question: str, example: dict) -> Optional[dict]:
+    """
+    检索得分足够高时，把新问题的条件值代入示例 SQL 直接执行；不适用时返回 None。
+    对齐得到的等值条件值必须是该列中实际存在的单元格值，大于/小于条件的值必须是数字，否则交给 LLM。
+    """
+    score = example.get("score") or 0.0
+    if score < Config.FAST_PATH_SCORE_THRESHOLD:
+        return None
+    # 词典已找到的条件值直接使用，其余的通过与示例问题对齐得到
+    example_conds = example["raw_sql"].get("conds", [])
+    value_conds = example.get("value_conds") or [None] * len(example_conds)
+    aligned = substitute_values(
+        question, example["question"], [c for c, v in zip(example_conds, value_conds) if v is None]
+    )
+    if aligned is None:
+        return None
+    for col, op, value in aligned:
+        if op == 0 and not value_exists(example["table_id"], col, value):
+            if sampled("fast_path_unknown_value"):
+                logging.info("Template fast path value %s is not in col%s, falling back to LLM", payload(value), col)
+            return None
+    aligned = iter(aligned)
+    conds = [next(aligned) if v is None else [c[0], c[1], v] for c, v in zip(example_conds, value_conds)]
+    sql = build_template_sql(example["table_id"], example["raw_sql"], conds)
+    if sql is None:
+        if sampled("fast_path_unsupported"):
+            logging.info("Template fast path cannot express the conditions (e.g. non-numeric range value)")
+        return None
+    query_result = run_query(sql)
+    # 聚合查询在没有匹配行时也会返回一行：MAX/MIN/SUM/AVG 为 NULL，COUNT 为 0
+    empty_rows = [(0,)] if example["raw_sql"].get("agg", 0) == Query.agg_ops.index("COUNT") else [(None,)]
+    if query_result["status"] != "ok" or not query_result["rows"] or query_result["rows"] == empty_rows:
+        if sampled("fast_path_miss"):
+            logging.info("Template fast path produced no rows, falling back to LLM: %s", payload(sql))
+        return None
+    if sampled("fast_path_hit"):
+        logging.info("Template fast path taken (score %.3f): %s", score, payload(sql))
+    return build_result(sql, query_result, "template")
+
 def generate_response(question: str, possible_answer: str, index_name: Optional[str] = None) -> dict:
     if index_name is None:
         index_name = PINECONE_INDEX_NAME
+    with stage("rag_model.generate_response") as span:
+        try:
+            # 查询 Pinecone 获取问题相关的元数据
+            with stage("encode"):
+                question_vector = get_embedding_service().encode(question)
+
+            # 相似问题已有答案时直接返回
+            with stage("answer_cache"):
+                cached = answer_cache.lookup(question_vector)
+            if cached is not None:
+                if sampled("answer_cache_hit"):
+                    logging.info("Answer cache hit (similarity %.3f)", cached['similarity'])
+                return dict(cached, cached=True, path="cache")
+
+            example = retrieve_example(question_vector, index_name, question)
+            if example is None:
+                return {"sql": "", "answer": "No relevant data found in the database."}
+            if not example["headers"]:
+                return {"sql": "", "answer": "Table metadata not found."}
+
+            # 检索足够可信时跳过 LLM
+            with stage("fast_path"):
+                fast_result = try_fast_path(question, example)
+            if fast_result is not None:
+                cache_answer(question_vector, fast_result)
+                return fast_result
+
+            # 调用 Ollama
+            llama_prompt = build_llama_prompt(question, example["initial_sql"])
+            ollama_response = generate_response_with_ollama(llama_prompt)
+
+            # 提取并清理 SQL 查询
+            with stage("clean"):
+                final_sql = extract_sql_from_ollama_response(ollama_response)
+                cleaned_sql = clean_sql_query(final_sql)
+
+            # 查询数据库
+            result = build_result(cleaned_sql, run_query(cleaned_sql), "llm")
+            if result["status"] == "ok":
+                cache_answer(question_vector, result)
+            else:
+                span.error = result["status"]
+            return result
+        except LLMQueueFull as e:
+            span.error = e
+            logging.warning("Rejected question, LLM is busy: %s", e)
+            return error_result(e)
+        except OllamaError as e:
+            span.error = e
+            return error_result(e)
+        except Exception as e:
+            span.error = e
+            logging.error("Unexpected error in generate_response: %s", e)
+            return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
+
+def error_result(e: Exception) -> dict:
+    """把单个问题处理中的异常转换为与 generate_response 相同格式的结果"""
+    if isinstance(e, LLMQueueFull):
+        return {"sql": "", "answer": "The server is busy, please try again later.", "busy": True}
+    if isinstance(e, OllamaError):
+        return {"sql": "", "answer": LLM_UNAVAILABLE_MESSAGE, "unavailable": True}
+    return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
+
+def generate_responses(questions, index_name: Optional[str] = None) -> list:
+    """
+    批量版本的 generate_response，按输入顺序返回结果，单个问题出错不影响其他问题。
+
+    所有问题一次提交给向量服务批量编码，检索并行执行，LLM 以批量优先级并行调用
+    （不超过 LLM_MAX_INFLIGHT），SQL 都在调用线程中执行，共用同一个只读连接。
+    """
+    if index_name is None:
+        index_name = PINECONE_INDEX_NAME
+    questions = list(questions)
+    results = [None] * len(questions)
     try:
-        # 查询 Pinecone 获取问题相关的元数据
-        pc = init_pinecone()
-        query_vector = embedding_model.encode(question).tolist()
-        results = query_pinecone(pc, index_name, query_vector, top_k=TOP_K)
-
-        if not results or not results.get("matches"):
-            logging.warning("No matches found in Pinecone query results.")
-            return {"sql": "", "answer": "No relevant data found in the database."}
-
-        best_match = results["matches"][0]
-        metadata = best_match.get("metadata", {})
-        table_id = metadata.get("table_id", "")
-        raw_sql = json.loads(metadata.get("sql", "{}"))
-        headers = get_table_headers(table_id)
+        vectors = get_embedding_service().encode_many(questions)
+    except Exception as e:
+        logging.error("Batched encode of %s questions failed: %s", len(questions), e)
+        return [error_result(e) for _ in questions]
 
-        if not headers:
-            return {"sql": "", "answer": "Table metadata not found."}
+    pending = []
+    for i, vector in enumerate(vectors):
+        cached = answer_cache.lookup(vector)
+        if cached is not None:
+            results[i] = dict(cached, cached=True, path="cache")
+        else:
+            pending.append(i)
 
-        # 构造初始 SQL
-        col_sel = headers.get(raw_sql["sel"], f"col{raw_sql['sel']}")
-        col_conds = [
-            f"{headers.get(cond[0], f'col{cond[0]}')} {['=', '>', '<'][cond[1]]} '{cond[2]}'"
-            for cond in raw_sql["conds"]
-        ]
-        initial_sql = f"SELECT {col_sel} FROM table_{table_id.replace('-', '_')} WHERE {' AND '.join(col_conds)};"
-        logging.info(f"Initial SQL: {initial_sql}")
-
-        # 调用 Ollama
-        llama_prompt = (
-            f"Question: {question}\n"
-            f"Initial SQL: {initial_sql}\n"
-            f"Instruction: Modify the SQL query to ensure the following:\n"
-            f"- The SQL syntax is valid and correct.\n"
-            f"- Do not change the table name or column names unless necessary.\n"
-            f"- Ensure all text comparisons (e.g., WHERE, AND, OR conditions) include 'COLLATE NOCASE' immediately after the value or column being compared to handle case-insensitivity.\n"
-            f"- For example: col_name = 'value' COLLATE NOCASE or 'value' COLLATE NOCASE = col_name.\n"
-            f"- Do not apply 'COLLATE NOCASE' to numerical or non-string comparisons.\n"
-            f"- Ensure that the SQL is optimized and matches the structure of the database.\n"
-            f"Return only the final SQL query."
-        )
-
-        ollama_response = generate_response_with_ollama(llama_prompt)
-        final_sql = extract_sql_from_ollama_response(ollama_response)
-
-        # 清理 SQL 查询
-        cleaned_sql = clean_sql_query(final_sql)
-
-        # 查询数据库
-        actual_answer = query_database(cleaned_sql)
-        return {"sql": cleaned_sql, "answer": actual_answer}
+    with ThreadPoolExecutor(max_workers=Config.BATCH_RETRIEVE_WORKERS, thread_name_prefix="batch-retrieve") as pool:
+        retrievals = {pool.submit(retrieve_example, vectors[i], index_name, questions[i]): i for i in pending}
+        examples = {}
+        for future in as_completed(retrievals):
+            i = retrievals[future]
+            try:
+                examples[i] = future.result()
+            except Exception as e:
+                logging.error("Retrieval failed for batch item %s: %s", i, e)
+                results[i] = error_result(e)
+
+    llm_pending = []
+    for i in sorted(examples):
+        example = examples[i]
+        if example is None:
+            results[i] = {"sql": "", "answer": "No relevant data found in the database."}
+        elif not example["headers"]:
+            results[i] = {"sql": "", "answer": "Table metadata not found."}
+        else:
+            try:
+                results[i] = try_fast_path(questions[i], example)
+            except Exception as e:
+                logging.error("Template fast path failed for batch item %s: %s", i, e)
+            if results[i] is not None:
+                cache_answer(vectors[i], results[i])
+            else:
+                llm_pending.append(i)
+
+    with ThreadPoolExecutor(max_workers=Config.LLM_MAX_INFLIGHT, thread_name_prefix="batch-llm") as pool:
+        generations = {
+            pool.submit(
+                generate_response_with_ollama, build_llama_prompt(questions[i], examples[i]["initial_sql"]),
+                priority=PRIORITY_BATCH
+            ): i
+            for i in llm_pending
+        }
+        for future in as_completed(generations):
+            i = generations[future]
+            try:
+                cleaned_sql = clean_sql_query(extract_sql_from_ollama_response(future.result()))
+                results[i] = build_result(cleaned_sql, run_query(cleaned_sql), "llm")
+                cache_answer(vectors[i], results[i])
+            except Exception as e:
+                if not isinstance(e, OllamaError):
+                    logging.error("LLM step failed for batch item %s: %s", i, e)
+                results[i] = error_result(e)
+    return results
+
+def generate_response_stream(question: str, index_name: Optional[str] = None):
+    """流式版本的 generate_response，依次产出 (事件名, 数据)：
+
+    example（检索到的示例）→ draft（生成中的 SQL）→ sql（最终 SQL）→ rows（查询结果），
+    出错时产出 error。
+    """
+    if index_name is None:
+        index_name = PINECONE_INDEX_NAME
+    try:
+        question_vector = get_embedding_service().encode(question)
+
+        cached = answer_cache.lookup(question_vector)
+        if cached is not None:
+            yield "sql", {"sql": cached["sql"], "cached": True, "path": "cache"}
+            yield "rows", {"answer": cached["answer"]}
+            return
+
+        example = retrieve_example(question_vector, index_name, question)
+        if example is None:
+            yield "error", {"error": "No relevant data found in the database."}
+            return
+        if not example["headers"]:
+            yield "error", {"error": "Table metadata not found."}
+            return
+        yield "example", {
+            "question": example["question"],
+            "table_id": example["table_id"],
+            "score": example["score"],
+            "initial_sql": example["initial_sql"],
+        }
+
+        fast_result = try_fast_path(question, example)
+        if fast_result is not None:
+            cache_answer(question_vector, fast_result)
+            yield "sql", {"sql": fast_result["sql"], "path": "template"}
+            yield "rows", {"answer": fast_result["answer"], "status": "ok", "truncated": fast_result["truncated"]}
+            return
+
+        draft = ""
+        for draft in stream_sql_from_ollama(build_llama_prompt(question, example["initial_sql"])):
+            yield "draft", {"sql": draft}
+        # 只保留第一条完整语句，丢弃前后多余的输出
+        cleaned_sql = clean_sql_query(extract_statement(draft))
+        yield "sql", {"sql": cleaned_sql, "path": "llm"}
+
+        # 在线程池中执行查询并定期发送心跳；客户端断开时生成器被关闭，查询随之中断
+        cancel_event = threading.Event()
+        future = sql_executor.submit(run_query, cleaned_sql, cancel_event)
+        try:
+            while True:
+                try:
+                    query_result = future.result(timeout=Config.SSE_HEARTBEAT_INTERVAL)
+                    break
+                except FutureTimeoutError:
+                    yield "heartbeat", {}
+        finally:
+            cancel_event.set()
+
+        result = build_result(cleaned_sql, query_result, "llm")
+        cache_answer(question_vector, result)
+        yield "rows", {"answer": result["answer"], "status": result["status"], "truncated": result["truncated"]}
+    except LLMQueueFull as e:
+        logging.warning("Rejected streaming question, LLM is busy: %s", e)
+        yield "error", {"error": "The server is busy, please try again later.", "busy": True}
+    except OllamaError:
+        yield "error", {"error": LLM_UNAVAILABLE_MESSAGE, "unavailable": True}
     except Exception as e:
-        logging.error(f"Unexpected error in generate_response: {e}")
-        return {"sql": "", "answer": "An unexpected error occurred while processing your request."}
+        logging.error("Unexpected error in generate_response_stream: %s", e)
+        yield "error", {"error": "An unexpected error occurred while processing your request."}
 
 #################################
 # 主程序
 #################################
 if __name__ == "__main__":
+    setup_logging()
     question = "Tell me what the notes are for South Australia"
     possible_answer = ""
     response = generate_response(question, possible_answer)
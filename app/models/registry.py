@@ -0,0 +1,176 @@
+import importlib
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+
+from config import Config
+
+#################################
+# 模型注册表：每个模型在进程内只加载一个实例，首次使用时才加载，
+# 也可以在启动时通过 warm_up 预先加载。
+#################################
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_loaders = {}
+_instances = {}
+_lock = threading.RLock()
+_import_times = {}
+_load_times = {}
+
+
+def register(name, loader):
+    """注册一个模型加载函数，不会立即加载"""
+    _loaders[name] = loader
+
+
+def get(name):
+    """获取共享的模型实例，首次调用时加载"""
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                logging.info(f"Loading model {name}...")
+                start = time.perf_counter()
+                instance = _loaders[name]()
+                _load_times[name] = time.perf_counter() - start
+                _instances[name] = instance
+                logging.info(f"Model {name} loaded in {_load_times[name]:.2f}s.")
+    return instance
+
+
+def peek(name):
+    """返回已加载的实例，尚未加载时返回 None（不会触发加载）"""
+    return _instances.get(name)
+
+
+def warm_up(names):
+    """启动时预先加载指定模型"""
+    for name in names:
+        get(name)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """包装模块加载器，记录 exec_module 的耗时（包含它触发的依赖导入）"""
+
+    def __init__(self, loader, fullname):
+        self._loader = loader
+        self._fullname = fullname
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _exec_times[self._fullname] = time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """meta-path 钩子：只给本项目的模块（prefixes）包一层计时加载器，模块被谁先导入都能拿到真实耗时"""
+
+    def __init__(self, prefixes):
+        self.prefixes = prefixes
+
+    def find_spec(self, fullname, path, target=None):
+        if not fullname.startswith(self.prefixes):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, fullname)
+        return spec
+
+
+_exec_times = {}
+if not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+    sys.meta_path.insert(0, _ImportTimer(("app.", "config")))
+
+
+def timed_import(module_name):
+    """导入模块并记录它首次导入的真实耗时
+
+    耗时来自 _ImportTimer 钩子，即使模块已被其他模块间接导入也不会记成 0；
+    早于本模块导入的模块无法计时，可用 python -X importtime 查看。
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_times[module_name] = _exec_times.get(module_name, time.perf_counter() - start)
+    return module
+
+
+def startup_report():
+    """返回各模块导入耗时与各模型加载耗时（秒）"""
+    return {"imports": dict(_import_times), "models": dict(_load_times)}
+
+
+def log_startup_report():
+    report = startup_report()
+    for module_name, seconds in report["imports"].items():
+        logging.info(f"Startup: imported {module_name} in {seconds:.3f}s")
+    for name, seconds in report["models"].items():
+        logging.info(f"Startup: loaded model {name} in {seconds:.3f}s")
+
+
+def _load_default_embedding_model():
+    from app.models.embedding_backends import load_embedding_model
+    return load_embedding_model(EMBEDDING_MODEL_NAME, Config.EMBEDDING_BACKEND)
+
+
+def _load_embedding_service():
+    from app.utils.embedding_cache import EmbeddingCache
+    from app.utils.embedding_service import EmbeddingService
+    cache = EmbeddingCache(
+        max_entries=Config.EMBED_CACHE_SIZE, disk_path=Config.EMBED_CACHE_PATH,
+        max_disk_entries=Config.EMBED_CACHE_DISK_MAX_ENTRIES,
+        namespace=f"{EMBEDDING_MODEL_NAME}:{Config.EMBEDDING_BACKEND}"
+    )
+    return EmbeddingService(
+        get(EMBEDDING_MODEL_NAME), window_ms=Config.EMBED_BATCH_WINDOW_MS, max_batch=Config.EMBED_MAX_BATCH,
+        cache=cache
+    )
+
+
+def _load_table_router():
+    from app.lib.table_router import load_router
+    return load_router(Config.TRAIN_DATABASE_PATH, Config.TABLE_ROUTER_PATH)
+
+
+def _load_value_index():
+    from app.lib.value_index import load_value_index
+    return load_value_index(Config.TRAIN_DATABASE_PATH, Config.VALUE_INDEX_PATH)
+
+
+register(EMBEDDING_MODEL_NAME, _load_default_embedding_model)
+register("embedding-service", _load_embedding_service)
+register("table-router", _load_table_router)
+register("value-index", _load_value_index)
+
+
+def get_embedding_service():
+    """rag_model 与 embedding2 共用的问题向量服务（同一个模型实例、缓存和批处理线程）"""
+    return get("embedding-service")
+
+
+def get_table_router():
+    """基于 train.db 的词法表路由（app.lib.table_router.TableRouter）"""
+    return get("table-router")
+
+
+def get_value_index():
+    """基于 train.db 的单元格值词典（app.lib.value_index.ValueIndex）"""
+    return get("value-index")
@@ -1,12 +1,14 @@
-from flask import Blueprint, request, jsonify, render_template
-from app.models.rag_model import generate_response
+from flask import Blueprint, request, jsonify, render_template, Response, stream_with_context
+from app.models.rag_model import generate_response, generate_response_stream, generate_responses
+from app.utils import metrics
+from app.utils.log_config import payload, sampled
+from config import Config
+import json
 import logging
-import whisper
 # 定义一个 Blueprint 实例，命名为 main
 main = Blueprint("main", __name__)
 
-# 配置日志记录
-logging.basicConfig(level=logging.INFO)
+# 日志在 create_app 中统一配置（见 app.utils.log_config）
 logger = logging.getLogger(__name__)
 
 @main.route("/", methods=["GET"])
@@ -17,6 +19,15 @@ def index():
     """
     return render_template("index.html")
 
+@main.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus 抓取接口：各阶段耗时、错误数、缓存命中率与队列长度"""
+    rendered = metrics.render()
+    if rendered is None:
+        return jsonify({"error": "Metrics are not enabled"}), 501
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
 @main.route('/query', methods=['POST'])
 def query():
     """
@@ -35,7 +46,8 @@ def query():
             return jsonify({"error": "Question cannot be empty"}), 400
 
         # 记录收到的问题
-        logger.info(f"Received question: {question}")
+        if sampled("received_question"):
+            logger.info("Received question: %s", payload(question))
 
         # 调用 RAG 系统
         rag_result = generate_response(question, possible_answer="")  # 传入用户问题
@@ -45,11 +57,90 @@ def query():
             logger.error("RAG system failed to provide a valid answer.")
             return jsonify({"error": "Failed to process the question"}), 500
 
+        # LLM 排队已满时快速拒绝
+        if rag_result.get("busy"):
+            return jsonify({"error": rag_result["answer"]}), 503
+        # Ollama 无法访问或返回错误
+        if rag_result.get("unavailable"):
+            return jsonify({"error": rag_result["answer"]}), 502
+
         # 获取并返回回答
         answer = rag_result.get("answer", "No answer provided.")
-        logger.info(f"RAG system response: {answer}")
-        return jsonify({"answer": answer})
+        if sampled("rag_response"):
+            logger.info("RAG system response: %s", payload(answer))
+        return jsonify({
+            "answer": answer,
+            "path": rag_result.get("path"),
+            "status": rag_result.get("status"),
+            "truncated": rag_result.get("truncated", False),
+        })
 
     except Exception as e:
-        logger.error(f"Error handling query: {e}", exc_info=True)
+        logger.error("Error handling query: %s", e, exc_info=True)
         return jsonify({"error": "Internal Server Error"}), 500
+
+@main.route('/query/batch', methods=['POST'])
+def query_batch():
+    """
+    批量处理问题：{"questions": [...]} → {"results": [...]}，结果与问题一一对应，
+    单个问题失败时对应结果中带有 error 字段。
+    """
+    try:
+        data = request.json
+        questions = data.get("questions") if isinstance(data, dict) else None
+        if not isinstance(questions, list) or not questions:
+            logger.warning("No questions provided in the batch request.")
+            return jsonify({"error": "No questions provided"}), 400
+        if len(questions) > Config.BATCH_MAX_QUESTIONS:
+            return jsonify({"error": f"At most {Config.BATCH_MAX_QUESTIONS} questions per request"}), 413
+        if not all(isinstance(q, str) and q.strip() for q in questions):
+            return jsonify({"error": "Questions must be non-empty strings"}), 400
+
+        logger.info("Received batch of %s questions", len(questions))
+        results = []
+        for rag_result in generate_responses([q.strip() for q in questions]):
+            if "status" not in rag_result:
+                # 没有执行 SQL：检索无结果、缺少表结构、LLM 繁忙或不可用、内部错误
+                item = {"error": rag_result["answer"]}
+                for flag in ("busy", "unavailable"):
+                    if rag_result.get(flag):
+                        item[flag] = True
+            else:
+                item = {
+                    "answer": rag_result["answer"],
+                    "path": rag_result.get("path"),
+                    "status": rag_result["status"],
+                    "truncated": rag_result.get("truncated", False),
+                }
+            results.append(item)
+        return jsonify({"results": results})
+
+    except Exception as e:
+        logger.error("Error handling batch query: %s", e, exc_info=True)
+        return jsonify({"error": "Internal Server Error"}), 500
+
+@main.route('/query/stream', methods=['GET'])
+def query_stream():
+    """
+    以 Server-Sent Events 的形式流式返回处理进度：
+    检索到的示例、生成中的 SQL、最终 SQL 和查询结果。
+    """
+    question = request.args.get("question", "").strip()
+    if not question:
+        logger.warning("Received an empty question.")
+        return jsonify({"error": "Question cannot be empty"}), 400
+
+    if sampled("received_question"):
+        logger.info("Received streaming question: %s", payload(question))
+
+    def events():
+        for event, data in generate_response_stream(question):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        # 通知前端关闭连接，避免 EventSource 自动重连
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
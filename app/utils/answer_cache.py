@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.utils.file_version import file_version
+from app.utils.vector_math import normalize_rows
+
+
+class AnswerCache:
+    """语义答案缓存：问题向量 → (最终 SQL, 答案)
+
+    新问题与已缓存问题的余弦相似度达到阈值即视为命中；
+    条目按 TTL 过期、按 LRU 淘汰，数据库文件变化（mtime/大小）时整体失效。
+    """
+
+    def __init__(self, threshold=0.97, ttl=3600, max_entries=2000, db_path=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._db_version = file_version(self.db_path)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_db_version(self):
+        version = file_version(self.db_path)
+        if version != self._db_version:
+            self._entries.clear()
+            self._matrix = None
+            self._db_version = version
+
+    def _ensure_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            if self._matrix_keys:
+                self._matrix = np.stack([self._entries[k][0] for k in self._matrix_keys])
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def lookup(self, vector):
+        """返回命中的结果字典，未命中返回 None"""
+        q = normalize_rows(np.reshape(vector, -1))
+        with self._lock:
+            self._check_db_version()
+            now = time.time()
+            expired = [k for k, (_, _, created) in self._entries.items() if now - created > self.ttl]
+            for k in expired:
+                del self._entries[k]
+            if expired:
+                self._matrix = None
+
+            matrix = self._ensure_matrix()
+            if len(matrix):
+                scores = matrix @ q
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = self._matrix_keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(self._entries[key][1], similarity=float(scores[best]))
+            self.misses += 1
+            return None
+
+    def store(self, vector, result):
+        """缓存一次成功的查询结果"""
+        with self._lock:
+            self._check_db_version()
+            self._entries[self._next_key] = (normalize_rows(np.reshape(vector, -1)), dict(result), time.time())
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
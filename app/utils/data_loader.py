@@ -1,8 +1,26 @@
-import jsonlines
+from itertools import islice
+
+try:
+    from orjson import loads as _loads
+except ImportError:  # 未安装 orjson 时退回标准库
+    from json import loads as _loads
+
+
+def iter_jsonl(file_path):
+    """逐行读取 JSONL 文件，内存占用与文件大小无关"""
+    with open(file_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+def batched(iterable, batch_size):
+    """把可迭代对象切成最多 batch_size 条的列表"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
 
 def load_jsonl(file_path):
-    data = []
-    with jsonlines.open(file_path) as reader:
-        for obj in reader:
-            data.append(obj)
-    return data
+    return list(iter_jsonl(file_path))
@@ -0,0 +1,156 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+re_whitespace = re.compile(r'\s+', flags=re.UNICODE)
+
+
+def normalize_question(text):
+    """规范化问题文本：小写、合并空白、去掉结尾标点，作为缓存键"""
+    text = re.sub(re_whitespace, ' ', text.lower()).strip()
+    return text.rstrip('?？.!。 ')
+
+
+class EmbeddingCache:
+    """问题向量缓存：内存 LRU + 可选的 SQLite 磁盘层（重启后仍然有效）
+
+    磁盘层最多保留 max_disk_entries 行，超出时按 last_used 删除最久未用的行；
+    磁盘读取走每线程各自的只读连接，不占用全局锁。
+    """
+
+    def __init__(self, max_entries=10000, disk_path=None, namespace="", max_disk_entries=200000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._disk_path = disk_path
+        self._db = None
+        self._readers = threading.local()
+        self._touched = set()
+        self._disk_rows = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_used INTEGER DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")}
+            if "last_used" not in columns:
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN last_used INTEGER DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._trim_disk()
+
+    def _key(self, text):
+        return f"{self.namespace}:{normalize_question(text)}"
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _reader(self):
+        """当前线程的磁盘层只读连接（WAL 模式下读不阻塞写）"""
+        reader = getattr(self._readers, "db", None)
+        if reader is None:
+            reader = sqlite3.connect(self._disk_path)
+            self._readers.db = reader
+        return reader
+
+    def _read_disk(self, key):
+        try:
+            return self._reader().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning("Failed to read embedding disk cache: %s", e)
+            return None
+
+    def _trim_disk(self):
+        """磁盘层超过上限时删除 last_used 最早的行，调用方需持有 _lock"""
+        if not self.max_disk_entries or self._disk_rows <= self.max_disk_entries:
+            return
+        # INSERT OR REPLACE 会让计数偏大，先校正；删到上限的 90%，避免每次写入都触发删除
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._disk_rows <= self.max_disk_entries:
+            return
+        excess = self._disk_rows - int(self.max_disk_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._db.commit()
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logging.info("Embedding disk cache trimmed %d least recently used rows", excess)
+
+    def get(self, text):
+        """命中返回向量，未命中返回 None"""
+        key = self._key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                if self._db is not None:
+                    self._touched.add(key)
+                self.hits += 1
+                return vector
+        row = self._read_disk(key) if self._db is not None else None
+        with self._lock:
+            if row:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                self._touched.add(key)
+                self.disk_hits += 1
+                return vector
+            self.misses += 1
+            return None
+
+    def put_many(self, texts, vectors):
+        """批量写入缓存，磁盘层在一个事务内提交，并顺带刷新命中行的 last_used"""
+        rows = []
+        now = int(time.time())
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                self._touched.discard(key)
+                rows.append((key, vector.tobytes(), now))
+            if self._db is not None and rows:
+                touched = [(now, key) for key in self._touched]
+                self._touched.clear()
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+                    )
+                    self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", touched)
+                    self._db.commit()
+                    self._disk_rows += len(rows)
+                    self._trim_disk()
+                except sqlite3.Error as e:
+                    logging.warning("Failed to persist embeddings to disk cache: %s", e)
+
+    def put(self, text, vector):
+        self.put_many([text], [vector])
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
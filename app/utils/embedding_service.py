@@ -0,0 +1,88 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EmbeddingService:
+    """把并发请求中的问题合并为一次批量 encode，再把各自的向量交还给调用方"""
+
+    def __init__(self, model, window_ms=5, max_batch=32, cache=None):
+        self.model = model
+        self.cache = cache
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_batch_size = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text) -> Future:
+        """提交一个待编码的文本，返回 Future；缓存命中时直接返回已完成的 Future"""
+        future = Future()
+        if self.cache is not None:
+            vector = self.cache.get(text)
+            if vector is not None:
+                future.set_result(vector)
+                return future
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text):
+        """编码单个文本，返回与 model.encode(text) 相同的向量"""
+        return self.submit(text).result()
+
+    def encode_many(self, texts):
+        """编码多个文本，按输入顺序返回向量列表"""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {"queue_depth": self._queue.qsize(), "last_batch_size": self._last_batch_size}
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # 先取走已经在排队的请求
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # 只有在最近出现过并发时才等待窗口期，低负载时不增加延迟
+        if self.window and self._last_batch_size > 1:
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch_size = len(batch)
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                logging.error("Batched encode of %s texts failed: %s", len(texts), e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            if self.cache is not None:
+                self.cache.put_many(texts, vectors)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
@@ -0,0 +1,40 @@
+import logging
+import os
+import time
+
+
+def file_version(path):
+    """文件的 (mtime_ns, size)，用来判断数据库文件是否变化；文件不存在或无法访问时返回 None"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def load_versioned(fdb, cache_path, load, build, empty, label):
+    """
+    读取与数据库文件版本一致的缓存对象，没有或已过期时重新构建并保存。
+
+    load(cache_path) 读取缓存对象，build() 基于 fdb 构建新对象，empty() 在数据库不存在时返回空对象；
+    缓存对象需要有 version 属性和 save(path) 方法。
+    """
+    if cache_path and os.path.exists(cache_path):
+        try:
+            cached = load(cache_path)
+            if cached.version == file_version(fdb):
+                return cached
+            logging.info(f"{label} cache {cache_path} is stale, rebuilding.")
+        except Exception as e:
+            logging.warning(f"Failed to load {label} cache {cache_path}: {e}")
+    if file_version(fdb) is None:
+        logging.warning(f"Database {fdb} does not exist, {label} is empty.")
+        return empty()
+    start = time.perf_counter()
+    built = build()
+    logging.info(f"Built {label} from {fdb} in {time.perf_counter() - start:.1f}s")
+    if cache_path:
+        built.save(cache_path)
+    return built
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+from config import Config
+
+
+def record_id(data):
+    """按内容生成稳定的向量 ID：问题、SQL 或 table_id 任一变化都会得到新 ID"""
+    content = json.dumps(
+        {"question": data["question"], "sql": data["sql"], "table_id": data.get("table_id", "unknown_table")},
+        sort_keys=True, ensure_ascii=False
+    )
+    return "q_" + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def default_manifest_path(index_name):
+    """
+    清单与它描述的索引放在一起：本地索引放在 LOCAL_INDEX_DIR/<index_name>/ 中，
+    Pinecone 使用 INDEX_MANIFEST_PATH。切换后端或本地目录时不会误把另一处的记录当作已上传。
+    """
+    if Config.VECTOR_BACKEND == "local":
+        return os.path.join(Config.LOCAL_INDEX_DIR, index_name, "manifest.db")
+    return Config.INDEX_MANIFEST_PATH
+
+
+class IndexManifest:
+    """
+    记录某个索引中已上传的向量 ID（本地 SQLite 文件）。
+
+    每次运行有一个 run_id：已存在的记录被标记为本次可见，新记录上传成功后按批提交；
+    运行结束时未被标记的记录即为过期记录。中途崩溃的运行在下次启动时沿用原 run_id 继续。
+    """
+
+    def __init__(self, path, index_name):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.index_name = index_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (index_name TEXT, id TEXT, run INTEGER, PRIMARY KEY (index_name, id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run INTEGER PRIMARY KEY AUTOINCREMENT, index_name TEXT, finished INTEGER)"
+        )
+        self.conn.commit()
+
+    def start_run(self):
+        """返回未完成的运行（断点续传）或新建一次运行"""
+        row = self.conn.execute(
+            "SELECT run FROM runs WHERE index_name = ? AND finished = 0 ORDER BY run DESC LIMIT 1", (self.index_name,)
+        ).fetchone()
+        if row:
+            return row[0]
+        cursor = self.conn.execute("INSERT INTO runs (index_name, finished) VALUES (?, 0)", (self.index_name,))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def known(self, ids):
+        """返回 ids 中已经上传过的子集"""
+        ids = list(ids)
+        found = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            found.update(r[0] for r in self.conn.execute(
+                f"SELECT id FROM vectors WHERE index_name = ? AND id IN ({placeholders})", [self.index_name] + chunk
+            ))
+        return found
+
+    def mark_seen(self, ids, run):
+        self.conn.executemany(
+            "UPDATE vectors SET run = ? WHERE index_name = ? AND id = ?", [(run, self.index_name, i) for i in ids]
+        )
+        self.conn.commit()
+
+    def commit_batch(self, ids, run):
+        """一批向量上传成功后调用"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO vectors (index_name, id, run) VALUES (?, ?, ?)",
+            [(self.index_name, i, run) for i in ids]
+        )
+        self.conn.commit()
+
+    def stale(self, run):
+        """本次运行中没有出现过的 ID（数据已删除或内容已变化）"""
+        return [r[0] for r in self.conn.execute(
+            "SELECT id FROM vectors WHERE index_name = ? AND run != ?", (self.index_name, run)
+        )]
+
+    def remove(self, ids):
+        self.conn.executemany(
+            "DELETE FROM vectors WHERE index_name = ? AND id = ?", [(self.index_name, i) for i in ids]
+        )
+        self.conn.commit()
+
+    def finish_run(self, run):
+        self.conn.execute("UPDATE runs SET finished = 1 WHERE run = ?", (run,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.log_config import sampled
+from config import Config
+
+# 数值越小优先级越高
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class LLMQueueFull(Exception):
+    """排队请求已达上限或等待超时，调用方应尽快返回"忙"而不是继续等待"""
+
+
+class _Ticket:
+    def __init__(self, session, wait_time):
+        self.session = session
+        self.wait_time = wait_time
+        self.generation_time = None
+
+
+class LLMScheduler:
+    """LLM 请求调度器：共享连接、限制并发生成数、按优先级排队并拒绝超额请求"""
+
+    def __init__(self, max_inflight=2, max_queue=32, queue_timeout=30.0):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_inflight, 1) * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_time = 0.0
+        self.total_generation_time = 0.0
+
+    def _acquire(self, priority):
+        start = time.monotonic()
+        with self._cond:
+            if self._inflight < self.max_inflight and not self._waiters:
+                self._inflight += 1
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise LLMQueueFull(f"LLM queue is full ({self.max_queue} waiting).")
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            deadline = start + self.queue_timeout
+            while not (self._inflight < self.max_inflight and self._waiters[0] == entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise LLMQueueFull(f"Timed out after {self.queue_timeout}s waiting for an LLM slot.")
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiters)
+            self._inflight += 1
+            # 可能还有空闲槽位，让下一个等待者重新检查
+            self._cond.notify_all()
+        return time.monotonic() - start
+
+    def _release(self, ticket):
+        with self._cond:
+            self._inflight -= 1
+            if ticket is not None:
+                self.completed += 1
+                self.total_wait_time += ticket.wait_time
+                self.total_generation_time += ticket.generation_time
+            self._cond.notify_all()
+
+    def _finish(self, ticket, start):
+        ticket.generation_time = time.monotonic() - start
+        self._release(ticket)
+        if sampled("llm_call_finished"):
+            logging.info(
+                f"LLM call finished: queue wait {ticket.wait_time:.3f}s, generation {ticket.generation_time:.3f}s"
+            )
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE):
+        """占用一个生成槽位，产出带共享 session 的 ticket；退出时记录排队与生成耗时"""
+        ticket = _Ticket(self.session, self._acquire(priority))
+        start = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self._finish(ticket, start)
+
+    @asynccontextmanager
+    async def async_slot(self, priority=PRIORITY_INTERACTIVE, executor=None):
+        """
+        slot 的 asyncio 版本：在 executor 的线程中排队等待槽位，
+        与同步调用共用同一并发限制、优先级队列和统计。
+        """
+        future = asyncio.get_running_loop().run_in_executor(executor, self._acquire, priority)
+        try:
+            wait_time = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 等待中被取消：线程稍后拿到的槽位直接归还
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self._release(None))
+            raise
+        ticket = _Ticket(self.session, wait_time)
+        start = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self._finish(ticket, start)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "inflight": self._inflight,
+                "queue_depth": len(self._waiters),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_time": self.total_wait_time / self.completed if self.completed else 0.0,
+                "avg_generation_time": self.total_generation_time / self.completed if self.completed else 0.0,
+            }
+
+
+# 进程内共享的调度器，所有 Ollama 调用都经过它
+scheduler = LLMScheduler(
+    max_inflight=Config.LLM_MAX_INFLIGHT,
+    max_queue=Config.LLM_MAX_QUEUE,
+    queue_timeout=Config.LLM_QUEUE_TIMEOUT,
+)
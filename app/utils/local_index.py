@@ -0,0 +1,366 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app.utils.vector_math import normalize_rows
+
+#################################
+# 本地向量索引
+#
+# 目录结构（每个索引一个子目录）：
+#   meta.json        维度、度量方式与当前数据文件的代号（generation）
+#   vectors.f32      归一化后的 float32 矩阵，按行追加，以 memmap 方式读取
+#   metadata.jsonl   元数据旁路文件（追加日志，后写覆盖先写，支持删除标记）
+#   partitions.npz   可选：近似检索用的聚类中心与行分区
+# compact 之后数据文件名带代号（如 vectors.2.f32），以原子替换 meta.json 作为切换点。
+#################################
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+PARTITIONS_FILE = "partitions.npz"
+
+
+class LocalIndex:
+    """进程内向量索引，接口与 Pinecone Index 的 upsert/query/delete 保持一致"""
+
+    def __init__(self, path, dimension=None, nprobe=0):
+        self.path = path
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dimension = meta["dimension"]
+            self.generation = meta.get("generation", 0)
+        else:
+            if dimension is None:
+                raise ValueError(f"Local index {path} does not exist and no dimension was given.")
+            os.makedirs(path, exist_ok=True)
+            self.dimension = int(dimension)
+            self.generation = 0
+            self._write_meta()
+        self._load()
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "metric": "cosine", "generation": self.generation}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _file(self, name, generation=None):
+        """数据文件的路径；第 0 代使用原始文件名，之后为 name.<代号>.ext"""
+        generation = self.generation if generation is None else generation
+        if not generation:
+            return os.path.join(self.path, name)
+        stem, ext = os.path.splitext(name)
+        return os.path.join(self.path, f"{stem}.{generation}{ext}")
+
+    #################################
+    # 加载
+    #################################
+    def _load(self):
+        self._ids = []
+        self._rows = {}
+        self._metadata = []
+        self._live = np.zeros(0, dtype=bool)
+
+        metadata_path = self._file(METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r+b") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # 写入中途崩溃留下的半行：截掉，之后的追加从新的一行开始
+                        logging.warning(f"Truncating incomplete last entry in {metadata_path}")
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if line.strip():
+                        self._apply_log_entry(json.loads(line))
+        self._truncate_orphans()
+        self._remap()
+        self._load_partitions()
+
+    def _truncate_orphans(self):
+        """
+        向量先于元数据写入：两次写入之间崩溃会在 vectors.f32 末尾留下没有 id 的行，
+        截掉这些行，使下一次追加的行号与元数据日志一致。
+        """
+        vectors_path = self._file(VECTORS_FILE)
+        if not os.path.exists(vectors_path):
+            return
+        expected = len(self._ids) * self.dimension * 4
+        size = os.path.getsize(vectors_path)
+        if size > expected:
+            logging.warning(f"Truncating {(size - expected) // (self.dimension * 4)} orphan rows in {vectors_path}")
+            with open(vectors_path, "r+b") as f:
+                f.truncate(expected)
+        elif size < expected:
+            raise ValueError(f"{vectors_path} has fewer rows than {METADATA_FILE} references.")
+
+    def _apply_log_entry(self, entry):
+        row = entry["row"]
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._metadata.append(None)
+        if entry.get("deleted"):
+            self._rows.pop(entry["id"], None)
+            self._ids[row] = None
+            self._metadata[row] = None
+        else:
+            self._rows[entry["id"]] = row
+            self._ids[row] = entry["id"]
+            self._metadata[row] = entry.get("metadata", {})
+
+    def _remap(self):
+        vectors_path = self._file(VECTORS_FILE)
+        n_rows = len(self._ids)
+        if n_rows and os.path.exists(vectors_path):
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dimension))
+        else:
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self._live = np.array([i is not None for i in self._ids], dtype=bool)
+
+    def _load_partitions(self):
+        self._centroids = None
+        self._assignments = None
+        partitions_path = self._file(PARTITIONS_FILE)
+        if os.path.exists(partitions_path):
+            data = np.load(partitions_path)
+            self._centroids = data["centroids"]
+            self._assignments = data["assignments"]
+
+    #################################
+    # 写入
+    #################################
+    def upsert(self, vectors, **kwargs):
+        """写入或更新向量，vectors 为 {"id", "values", "metadata"} 字典列表"""
+        if not vectors:
+            return {"upserted_count": 0}
+        with self._lock:
+            values = normalize_rows(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+            if values.shape[1] != self.dimension:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match index dimension {self.dimension}.")
+
+            updates, appends, log_entries = [], [], []
+            next_row = len(self._ids)
+            pending = {}
+            for i, v in enumerate(vectors):
+                row = self._rows.get(v["id"], pending.get(v["id"]))
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                    pending[v["id"]] = row
+                    appends.append(i)
+                else:
+                    updates.append((row, i))
+                log_entries.append({"id": v["id"], "row": row, "metadata": v.get("metadata", {})})
+
+            vectors_path = self._file(VECTORS_FILE)
+            if appends:
+                # 上一次写入失败时可能留下孤立的行
+                self._truncate_orphans()
+                with open(vectors_path, "ab") as f:
+                    f.write(values[appends].tobytes())
+            if updates:
+                writable = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(next_row, self.dimension))
+                for row, i in updates:
+                    writable[row] = values[i]
+                writable.flush()
+                del writable
+
+            with open(self._file(METADATA_FILE), "a", encoding="utf-8") as f:
+                for entry in log_entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    self._apply_log_entry(entry)
+            self._remap()
+            return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, **kwargs):
+        """按 id 删除向量（写入删除标记，空间在 compact 时回收）"""
+        with self._lock:
+            entries = [{"id": i, "row": self._rows[i], "deleted": True} for i in ids or [] if i in self._rows]
+            if not entries:
+                return {}
+            with open(self._file(METADATA_FILE), "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+                    self._apply_log_entry(entry)
+            self._live = np.array([i is not None for i in self._ids], dtype=bool)
+            return {}
+
+    def compact(self, min_dead_ratio=0.0):
+        """
+        只保留存活的行，重写向量文件、元数据日志与分区，回收删除和覆盖留下的空间。
+        已删除的行不超过 min_dead_ratio 时不做任何事；返回回收的行数。
+        """
+        with self._lock:
+            rows = np.flatnonzero(self._live)
+            n_dead = len(self._ids) - len(rows)
+            if not n_dead or n_dead <= min_dead_ratio * len(self._ids):
+                return 0
+
+            generation = self.generation + 1
+            with open(self._file(VECTORS_FILE, generation), "wb") as f:
+                for start in range(0, len(rows), 65536):
+                    f.write(np.ascontiguousarray(self._vectors[rows[start:start + 65536]]).tobytes())
+            with open(self._file(METADATA_FILE, generation), "w", encoding="utf-8") as f:
+                for new_row, row in enumerate(rows):
+                    entry = {"id": self._ids[row], "row": new_row, "metadata": self._metadata[row]}
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            if self._assignments is not None:
+                # 行顺序不变，分区建立之后追加的行仍排在最后
+                kept = rows[rows < len(self._assignments)]
+                np.savez(self._file(PARTITIONS_FILE, generation), centroids=self._centroids,
+                         assignments=self._assignments[kept])
+
+            old_files = [self._file(name) for name in (VECTORS_FILE, METADATA_FILE, PARTITIONS_FILE)]
+            self._vectors = None
+            self.generation = generation
+            self._write_meta()
+            for old in old_files:
+                if os.path.exists(old):
+                    os.remove(old)
+            self._load()
+            logging.info(f"Compacted local index {self.path}: removed {n_dead} rows, {len(rows)} remain.")
+            return n_dead
+
+    #################################
+    # 查询
+    #################################
+    def query(self, vector, top_k=1, include_metadata=False, nprobe=None, **kwargs):
+        """返回与 Pinecone 相同结构的 {"matches": [{"id", "score", "metadata"}]}"""
+        with self._lock:
+            vectors, live, ids, metadata = self._vectors, self._live, self._ids, self._metadata
+            centroids, assignments = self._centroids, self._assignments
+        if not len(vectors):
+            return {"matches": []}
+
+        q = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        nprobe = self.nprobe if nprobe is None else nprobe
+        if nprobe and centroids is not None:
+            # 近似模式只取出候选分区的行
+            candidates = self._probe(q, nprobe, centroids, assignments, len(vectors))
+            candidates = candidates[live[candidates]]
+            n_live = len(candidates)
+            if not n_live:
+                return {"matches": []}
+            scores = vectors[candidates] @ q
+        else:
+            # 精确模式直接在 memmap 上做矩阵乘法，已删除的行得分置为 -inf，避免复制所有存活行
+            candidates = None
+            n_live = int(live.sum())
+            if not n_live:
+                return {"matches": []}
+            scores = vectors @ q
+            scores[~live] = -np.inf
+
+        k = min(top_k, n_live)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            row = int(i) if candidates is None else int(candidates[i])
+            match = {"id": ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    @staticmethod
+    def _probe(q, nprobe, centroids, assignments, n_rows):
+        """近似模式：只扫描最近的 nprobe 个分区，以及分区建立之后新写入的行"""
+        nearest = np.argsort(-(centroids @ q))[:nprobe]
+        candidates = np.flatnonzero(np.isin(assignments, nearest))
+        if n_rows > len(assignments):
+            candidates = np.concatenate([candidates, np.arange(len(assignments), n_rows)])
+        return candidates
+
+    def build_partitions(self, n_lists, n_iter=10, sample_size=100000, seed=0):
+        """对现有向量做 k-means，生成近似检索用的分区"""
+        with self._lock:
+            vectors = np.asarray(self._vectors)
+            if not len(vectors):
+                raise ValueError("Cannot build partitions for an empty index.")
+            rng = np.random.default_rng(seed)
+            n_lists = min(n_lists, len(vectors))
+            sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+            centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+            for _ in range(n_iter):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = normalize_rows(centroids)
+
+            assignments = np.empty(len(vectors), dtype=np.int32)
+            for start in range(0, len(vectors), 65536):
+                block = vectors[start:start + 65536]
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            np.savez(self._file(PARTITIONS_FILE), centroids=centroids, assignments=assignments)
+            self._centroids, self._assignments = centroids, assignments
+            logging.info(f"Built {n_lists} partitions for local index {self.path}.")
+
+    def describe_index_stats(self, **kwargs):
+        return {"dimension": self.dimension, "total_vector_count": int(self._live.sum())}
+
+
+class _IndexList(list):
+    def names(self):
+        return list(self)
+
+
+class LocalVectorClient:
+    """模拟 Pinecone 客户端：list_indexes / create_index / Index"""
+
+    def __init__(self, base_dir, nprobe=0):
+        self.base_dir = base_dir
+        self.nprobe = nprobe
+        self._indexes = {}
+        self._lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def list_indexes(self):
+        return _IndexList(
+            name for name in sorted(os.listdir(self.base_dir))
+            if os.path.exists(os.path.join(self.base_dir, name, META_FILE))
+        )
+
+    def create_index(self, name, dimension, metric="cosine", spec=None, **kwargs):
+        if metric != "cosine":
+            raise ValueError("Local index only supports the cosine metric.")
+        with self._lock:
+            self._indexes[name] = LocalIndex(os.path.join(self.base_dir, name), dimension=dimension, nprobe=self.nprobe)
+
+    def Index(self, name):
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = LocalIndex(os.path.join(self.base_dir, name), nprobe=self.nprobe)
+            return self._indexes[name]
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.utils.log_config import setup_logging
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="为本地向量索引构建近似检索分区")
+    parser.add_argument("index_name")
+    parser.add_argument("--lists", type=int, default=256)
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+    LocalVectorClient(Config.LOCAL_INDEX_DIR).Index(args.index_name).build_partitions(args.lists)
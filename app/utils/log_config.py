@@ -0,0 +1,102 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import Config
+
+#################################
+# 统一的日志配置：
+#   - 根 logger 只挂一个 DeferredQueueHandler，格式化输出和写文件在 QueueListener 的后台线程中完成；
+#   - sampled(key) 对高频事件抽样，未抽中的消息不会被格式化；
+#   - payload(text) 截断提示词、模型输出、SQL 和查询结果等长字段；
+#   - Config.LOG_DEBUG_PAYLOADS（环境变量 LOG_DEBUG=1）打开后不抽样、不截断。
+#################################
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_listener = None
+_counters = {}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    把 LogRecord 原样放入进程内队列。QueueHandler.prepare 会在调用线程中格式化消息和异常堆栈，
+    这里跳过这一步，由 QueueListener 线程中的 handler 格式化。
+    调用方要用 %-风格参数（logging.info("... %s", x)）才能受益，f-string 在调用线程中就已拼接好。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=None):
+    """配置根 logger；重复调用只会调整日志级别"""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level if level is not None else Config.LOG_LEVEL)
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if Config.LOG_FILE:
+        handlers.append(logging.FileHandler(Config.LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def file_logger(name, path, max_bytes, backup_count):
+    """
+    写入单独文件的 logger（如 QueryLog）：消息原样写入按大小轮转的文件，
+    与根 logger 一样经队列由后台线程写盘，不传播到根 logger。
+    """
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def sampled(key, every=None) -> bool:
+    """同一 key 每 every 次返回一次 True（第一次总是 True）；调试模式下总是 True"""
+    if Config.LOG_DEBUG_PAYLOADS:
+        return True
+    every = every or Config.LOG_SAMPLE_EVERY
+    if every <= 1:
+        return True
+    counter = _counters.get(key)
+    if counter is None:
+        counter = _counters.setdefault(key, itertools.count())
+    return next(counter) % every == 0
+
+
+def payload(value, limit=None) -> str:
+    """把长字段截断到 limit 个字符并注明原长度；调试模式下返回完整内容"""
+    text = value if isinstance(value, str) else repr(value)
+    if Config.LOG_DEBUG_PAYLOADS:
+        return text
+    limit = limit or Config.LOG_PAYLOAD_LIMIT
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
@@ -0,0 +1,96 @@
+import logging
+
+from app.utils import tracing
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # 未安装时 /metrics 返回 501，其余功能不受影响
+    CollectorRegistry = None
+
+#################################
+# Prometheus 指标：
+#   text_to_sql_stage_seconds{stage}          各阶段耗时直方图（来自 app.utils.tracing.stage）
+#   text_to_sql_stage_errors_total{stage}     各阶段失败次数
+#   缓存命中、LLM 排队与向量服务队列等指标在抓取时从各组件的 stats() 读取。
+#################################
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+registry = None
+_stage_seconds = None
+_stage_errors = None
+
+
+def _observe(name, seconds, error):
+    _stage_seconds.labels(name).observe(seconds)
+    if error is not None:
+        _stage_errors.labels(name).inc()
+
+
+def _hit_metrics(prefix, description, stats, results):
+    lookups = CounterMetricFamily(f"{prefix}_lookups", f"{description} lookups by result", labels=["result"])
+    for result, key in results:
+        lookups.add_metric([result], stats[key])
+    yield lookups
+    yield GaugeMetricFamily(f"{prefix}_hit_ratio", f"{description} hit ratio since start", value=stats["hit_rate"])
+    yield GaugeMetricFamily(f"{prefix}_entries", f"{description} entries in memory", value=stats["entries"])
+
+
+class PipelineCollector:
+    """抓取时读取答案缓存、向量缓存、向量服务与 LLM 调度器的当前状态"""
+
+    def collect(self):
+        from app.models import registry as model_registry
+        from app.models.rag_model import answer_cache
+        from app.utils.llm_scheduler import scheduler
+
+        yield from _hit_metrics(
+            "text_to_sql_answer_cache", "Semantic answer cache", answer_cache.stats(),
+            [("hit", "hits"), ("miss", "misses")]
+        )
+
+        service = model_registry.peek("embedding-service")
+        if service is not None:
+            service_stats = service.stats()
+            yield GaugeMetricFamily("text_to_sql_embedding_queue_depth", "Questions waiting to be encoded",
+                                    value=service_stats["queue_depth"])
+            yield GaugeMetricFamily("text_to_sql_embedding_last_batch_size", "Size of the last encode batch",
+                                    value=service_stats["last_batch_size"])
+            if service.cache is not None:
+                yield from _hit_metrics(
+                    "text_to_sql_embedding_cache", "Question embedding cache", service.cache.stats(),
+                    [("hit", "hits"), ("disk_hit", "disk_hits"), ("miss", "misses")]
+                )
+
+        llm_stats = scheduler.stats()
+        yield GaugeMetricFamily("text_to_sql_llm_inflight", "LLM generations in progress", value=llm_stats["inflight"])
+        yield GaugeMetricFamily("text_to_sql_llm_queue_depth", "Requests waiting for an LLM slot",
+                                value=llm_stats["queue_depth"])
+        yield CounterMetricFamily("text_to_sql_llm_completed", "Finished LLM generations",
+                                  value=llm_stats["completed"])
+        yield CounterMetricFamily("text_to_sql_llm_rejected", "LLM requests rejected because the queue was full",
+                                  value=llm_stats["rejected"])
+
+
+def install():
+    """创建指标并开始接收阶段耗时；未安装 prometheus_client 时什么也不做"""
+    global registry, _stage_seconds, _stage_errors
+    if registry is not None:
+        return
+    if CollectorRegistry is None:
+        logging.warning("prometheus_client is not installed, /metrics is disabled.")
+        return
+    new_registry = CollectorRegistry()
+    _stage_seconds = Histogram("text_to_sql_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+                               buckets=STAGE_BUCKETS, registry=new_registry)
+    _stage_errors = Counter("text_to_sql_stage_errors", "Failed pipeline stages", ["stage"], registry=new_registry)
+    new_registry.register(PipelineCollector())
+    registry = new_registry
+    tracing.add_listener(_observe)
+
+
+def render():
+    """返回 (Prometheus 文本格式的指标, Content-Type)；未启用时返回 None"""
+    if registry is None:
+        return None
+    return generate_latest(registry), CONTENT_TYPE_LATEST
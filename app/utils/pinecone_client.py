@@ -1,20 +1,80 @@
 import logging
-from pinecone import Pinecone, ServerlessSpec
+import threading
 from config import Config
+from app.utils.local_index import LocalVectorClient
+from app.utils.log_config import payload, sampled
+
+try:
+    from pinecone import Pinecone, ServerlessSpec
+except ImportError:  # 仅使用本地索引时不需要安装 pinecone
+    Pinecone = ServerlessSpec = None
+
+#################################
+# 进程级客户端 / 索引句柄注册表
+# 客户端与 Index 句柄只创建一次，复用其中的 HTTP 连接池，
+# 避免每个请求都重新握手和查询索引 host。
+#################################
+_client = None
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def _create_client():
+    if Config.VECTOR_BACKEND == "local":
+        pc = LocalVectorClient(Config.LOCAL_INDEX_DIR, nprobe=Config.LOCAL_INDEX_NPROBE)
+        logging.info("Initialized local vector index at %s.", Config.LOCAL_INDEX_DIR)
+        return pc
+    pc = Pinecone(api_key=Config.PINECONE_API_KEY, pool_threads=Config.PINECONE_POOL_THREADS)
+    logging.info("Initialized Pinecone client successfully.")
+    return pc
 
-# 设置日志配置
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 def init_pinecone():
-    """初始化 Pinecone 客户端"""
+    """获取进程内共享的向量库客户端（根据 Config.VECTOR_BACKEND 选择 Pinecone 或本地索引）"""
+    global _client
+    if _client is not None:
+        return _client
     try:
-        pc = Pinecone(api_key=Config.PINECONE_API_KEY)
-        logging.info("Initialized Pinecone client successfully.")
-        return pc
+        with _registry_lock:
+            if _client is None:
+                _client = _create_client()
+        return _client
     except Exception as e:
-        logging.error(f"Failed to initialize Pinecone: {e}")
+        logging.error("Failed to initialize Pinecone: %s", e)
         raise
 
+def get_index(pinecone_client, index_name):
+    """获取缓存的 Index 句柄，不存在时创建"""
+    key = (id(pinecone_client), index_name)
+    index = _indexes.get(key)
+    if index is None:
+        with _registry_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = pinecone_client.Index(index_name)
+                _indexes[key] = index
+    return index
+
+def reset_index(pinecone_client, index_name):
+    """丢弃缓存的 Index 句柄（连接失效时调用），下次访问会重新创建"""
+    with _registry_lock:
+        _indexes.pop((id(pinecone_client), index_name), None)
+
+def warm_up(index_names):
+    """在应用启动时预先创建客户端和索引句柄，并发起一次请求建立连接"""
+    try:
+        pc = init_pinecone()
+    except Exception as e:
+        logging.warning("Skipping index warm-up: %s", e)
+        return
+    for index_name in index_names:
+        try:
+            get_index(pc, index_name).describe_index_stats()
+            logging.info("Warmed up index: %s", index_name)
+        except Exception as e:
+            reset_index(pc, index_name)
+            logging.warning("Failed to warm up index %s: %s", index_name, e)
+
 def create_or_connect_index(pinecone_client, index_name, dimension):
     """创建或连接到 Pinecone 索引"""
     try:
@@ -27,55 +87,74 @@ def create_or_connect_index(pinecone_client, index_name, dimension):
                 spec=ServerlessSpec(
                     cloud="aws",
                     region=Config.PINECONE_ENV
-                )
+                ) if ServerlessSpec else None
             )
-            logging.info(f"Created new Pinecone index: {index_name}")
+            logging.info("Created new Pinecone index: %s", index_name)
         else:
-            logging.info(f"Index {index_name} already exists.")
-        return pinecone_client.Index(index_name)
+            logging.info("Index %s already exists.", index_name)
+        return get_index(pinecone_client, index_name)
     except Exception as e:
-        logging.error(f"Failed to create or connect to index {index_name}: {e}")
+        logging.error("Failed to create or connect to index %s: %s", index_name, e)
         raise
 
 def upsert_vectors(pinecone_client, index_name, vectors, batch_size=100):
     """上传向量到 Pinecone"""
     try:
-        index = pinecone_client.Index(index_name)
+        index = get_index(pinecone_client, index_name)
         for i in range(0, len(vectors), batch_size):
             batch = vectors[i:i + batch_size]
             index.upsert(vectors=batch)
-            logging.info(f"Upserted batch {i // batch_size + 1} to Pinecone.")
-        logging.info(f"All {len(vectors)} vectors upserted successfully.")
+            logging.info("Upserted batch %s to Pinecone.", i // batch_size + 1)
+        logging.info("All %s vectors upserted successfully.", len(vectors))
     except Exception as e:
-        logging.error(f"Failed to upsert vectors to index {index_name}: {e}")
+        logging.error("Failed to upsert vectors to index %s: %s", index_name, e)
+        raise
+
+def delete_vectors(pinecone_client, index_name, ids, batch_size=1000):
+    """按 ID 从索引中删除向量"""
+    try:
+        index = get_index(pinecone_client, index_name)
+        for i in range(0, len(ids), batch_size):
+            index.delete(ids=ids[i:i + batch_size])
+        logging.info("Deleted %s vectors from index %s.", len(ids), index_name)
+    except Exception as e:
+        logging.error("Failed to delete vectors from index %s: %s", index_name, e)
         raise
 
 def query_pinecone(pinecone_client, index_name, vector, top_k=1):
     """查询 Pinecone 索引"""
     try:
-        print(f"Querying Pinecone index: {index_name}...")
-        index = pinecone_client.Index(index_name)
+        index = get_index(pinecone_client, index_name)
 
-        # 查询索引
-        results = index.query(vector=vector, top_k=top_k, include_metadata=True)
+        # 查询索引；缓存的连接失效时重建句柄并重试一次
+        try:
+            results = index.query(vector=vector, top_k=top_k, include_metadata=True)
+        except Exception as e:
+            logging.warning("Query on cached index %s failed, reconnecting: %s", index_name, e)
+            reset_index(pinecone_client, index_name)
+            index = get_index(pinecone_client, index_name)
+            results = index.query(vector=vector, top_k=top_k, include_metadata=True)
 
         # 检查是否有匹配结果
         if not results or "matches" not in results or len(results["matches"]) == 0:
-            print("No matches found. Possible reasons:")
-            print("1. The vector is not similar to existing vectors in the index.")
-            print("2. The index name is incorrect or does not contain relevant data.")
-            print("3. Pinecone query parameters need adjustment (e.g., top_k).")
+            if sampled("pinecone_no_match"):
+                logging.warning(
+                    "No matches found in index %s: the vector may not be similar to any stored vector, "
+                    "or the index may be empty or misnamed.", index_name
+                )
             return None
 
-        # 打印匹配结果
-        print("Pinecone Query Results for Text-to-SQL:")
-        for match in results.get("matches", []):
-            metadata = match.get("metadata", {})
-            question = metadata.get("question", "No question")
-            sql = metadata.get("sql", "No SQL")
-            print(f"ID: {match['id']}, Score: {match['score']}, Question: {question}, SQL: {sql}")
+        # 记录匹配结果
+        if sampled("pinecone_matches"):
+            for match in results["matches"]:
+                metadata = match.get("metadata", {})
+                logging.info(
+                    "Match in %s: ID: %s, Score: %s, Question: %s, SQL: %s",
+                    index_name, match['id'], match['score'],
+                    payload(metadata.get('question', 'No question')), payload(metadata.get('sql', 'No SQL'))
+                )
 
         return results
     except Exception as e:
-        print(f"Error querying Pinecone index: {e}")
+        logging.error("Error querying Pinecone index %s: %s", index_name, e)
         return None
@@ -0,0 +1,26 @@
+import glob
+import json
+import os
+
+from app.utils.log_config import file_logger, sampled
+
+
+class QueryLog:
+    """
+    把线上执行过的 SQL 按 JSONL 格式抽样记录，供索引建议器（app.lib.index_advisor）分析。
+    写盘在日志队列的后台线程中完成，文件超过 max_bytes 后轮转为 path.1、path.2……
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backup_count=3, sample_every=1):
+        self.path = path
+        self.sample_every = sample_every
+        self._logger = file_logger('text_to_sql.query_log', path, max_bytes, backup_count)
+
+    def record(self, sql):
+        if sampled('query_log', self.sample_every):
+            self._logger.info(json.dumps({'sql': sql}, ensure_ascii=False))
+
+
+def query_log_files(path):
+    """QueryLog 的当前文件和轮转出的旧文件"""
+    return [p for p in [path] + sorted(glob.glob(path + '.[0-9]*')) if os.path.exists(p)]
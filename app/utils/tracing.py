@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+
+#################################
+# 流水线阶段计时：各阶段用 stage(name) 包裹，
+# 结束时通知已注册的监听器 listener(name, seconds, error)，没有监听器时只多一次计时。
+#################################
+_listeners = []
+
+
+class Span:
+    """stage 产出的对象；阶段没有抛出异常但结果是失败时，可以设置 error 记录原因"""
+    __slots__ = ("name", "error")
+
+    def __init__(self, name):
+        self.name = name
+        self.error = None
+
+
+def add_listener(listener):
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+@contextmanager
+def stage(name):
+    """记录一个阶段的耗时；阶段内抛出的异常会传给监听器后继续向上抛出"""
+    span = Span(name)
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in tuple(_listeners):
+            listener(name, elapsed, span.error)
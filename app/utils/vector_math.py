@@ -0,0 +1,9 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """按行做 L2 归一化，使点积等价于余弦相似度；零向量保持不变"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
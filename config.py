@@ -1,5 +1,101 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
 class Config:
     SECRET_KEY = "default_secret_key"  # 可替换为你自己的
     PINECONE_API_KEY = "pcsk_5U9NYr_JDQVstqgVePxuAEBMCrKLt8CbdeRdv9aGBrFGiEbV5XEWCnDSw5DzwVLPfpJNYk"
     PINECONE_ENV = "us-east-1"  # 使用你的环境名称
     DATABASE_URI = 'data/sample.db'  # 数据库路径
+    TRAIN_DATABASE_PATH = os.path.join(BASE_DIR, "data", "train.db")  # WikiSQL 表数据
+
+    # 向量库后端："pinecone" 使用远程服务，"local" 使用进程内索引
+    VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_DIR = os.path.join(BASE_DIR, "data", "vector_index")
+    LOCAL_INDEX_NPROBE = 0  # 0 表示精确检索，>0 表示近似检索时扫描的分区数
+    LOCAL_INDEX_COMPACT_RATIO = 0.2  # 增量索引结束时，已删除/被覆盖的行超过该比例则压缩本地索引
+    PINECONE_POOL_THREADS = 4  # Pinecone SDK 的 pool_threads：async_req 异步请求线程池的线程数（不是 HTTP 连接池大小）
+    WARMUP_INDEXES = ["text-to-sql-index"]  # 应用启动时预热的索引
+
+    # 问题向量微批处理：等待窗口（毫秒）与单批最大条数
+    EMBED_BATCH_WINDOW_MS = 3
+    EMBED_MAX_BATCH = 64
+
+    # 问题向量缓存：内存 LRU 条数、磁盘层路径（None 表示只用内存）与磁盘层最大行数（按最近使用淘汰）
+    EMBED_CACHE_SIZE = 50000
+    EMBED_CACHE_PATH = os.path.join(BASE_DIR, "data", "embedding_cache.db")
+    EMBED_CACHE_DISK_MAX_ENTRIES = 200000
+
+    # 语义答案缓存：命中所需的余弦相似度、过期时间（秒）与最大条数
+    ANSWER_CACHE_THRESHOLD = 0.97
+    ANSWER_CACHE_TTL = 3600
+    ANSWER_CACHE_SIZE = 2000
+
+    # LLM 调度：最大并发生成数、最大排队数与排队超时（秒）
+    LLM_MAX_INFLIGHT = 2
+    LLM_MAX_QUEUE = 32
+    LLM_QUEUE_TIMEOUT = 30
+
+    # 模板快速路径：检索得分不低于该阈值时直接代入条件值执行，跳过 LLM
+    FAST_PATH_SCORE_THRESHOLD = 0.9
+
+    # 词法表路由（app.lib.table_router）：向量检索取回的候选数、路由名单长度与索引缓存文件；
+    # 候选中第一个表在路由名单内的示例会被优先使用
+    TABLE_ROUTER_ENABLED = True
+    TABLE_ROUTER_CANDIDATES = 5
+    TABLE_ROUTER_SHORTLIST = 10
+    TABLE_ROUTER_PATH = os.path.join(BASE_DIR, "data", "table_router.pkl")
+
+    # 单元格值词典（app.lib.value_index）：用问题中出现的单元格值填充示例 SQL 的等值条件
+    VALUE_INDEX_ENABLED = True
+    VALUE_INDEX_PATH = os.path.join(BASE_DIR, "data", "value_index.npz")
+
+    # SQLite 只读连接池；immutable 仅在 train.db 不会被修改时开启
+    SQLITE_IMMUTABLE = False
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB = 64 * 1024
+    SQLITE_CACHED_STATEMENTS = 512
+
+    # SQL 执行保护：单条查询超时（秒）、最多返回行数；流式接口执行 SQL 的线程数与心跳间隔（秒）
+    SQL_TIMEOUT = 5
+    SQL_MAX_ROWS = 1000
+    SQL_EXECUTOR_WORKERS = 8
+    SSE_HEARTBEAT_INTERVAL = 0.5
+
+    # 批量接口：单次请求最多问题数、并行检索的线程数（LLM 并发沿用 LLM_MAX_INFLIGHT）
+    BATCH_MAX_QUESTIONS = 5000
+    BATCH_RETRIEVE_WORKERS = 8
+
+    # 日志：级别、可选的日志文件、长字段截断长度与高频事件抽样间隔；
+    # LOG_DEBUG=1 时不抽样、不截断，输出完整的提示词与模型输出
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_FILE = None
+    LOG_PAYLOAD_LIMIT = 200
+    LOG_SAMPLE_EVERY = 100
+    LOG_DEBUG_PAYLOADS = os.environ.get("LOG_DEBUG") == "1"
+
+    # 异步接口（app.asgi）：编码与 SQLite 使用的线程数、HTTP 连接池上限与向量库请求超时（秒）
+    ASYNC_EXECUTOR_WORKERS = 8
+    ASYNC_HTTP_MAX_CONNECTIONS = 100
+    ASYNC_VECTOR_TIMEOUT = 10
+
+    # 线上 SQL 日志（app.utils.query_log，供 app.lib.index_advisor 分析）：默认不记录，
+    # 设为文件路径（如 data/query_log.jsonl）后每 QUERY_LOG_SAMPLE_EVERY 条记录一条，按大小轮转
+    QUERY_LOG_PATH = None
+    QUERY_LOG_SAMPLE_EVERY = 1
+    QUERY_LOG_MAX_BYTES = 50 * 1024 * 1024
+    QUERY_LOG_BACKUPS = 3
+
+    # 增量索引清单：记录每个 Pinecone 索引中已上传的向量 ID（本地索引的清单在各自的目录中）
+    INDEX_MANIFEST_PATH = os.path.join(BASE_DIR, "data", "index_manifest.db")
+
+    # 句向量推理后端："torch"（fp32）、"int8"（动态量化）或 "onnx"；
+    # 切换前可用 python -m app.models.embedding_backends --backend int8 检查召回损失
+    EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+    EMBEDDING_ONNX_FILE = "onnx/model_quint8_avx2.onnx"  # onnx 后端加载的文件，None 表示未量化的 onnx/model.onnx
+
+    # 应用启动时预加载的模型（见 app.models.registry），为空表示首次使用时再加载；
+    # "table-router" 与 "value-index" 要扫描 train.db，默认在首次使用时加载，
+    # 也可先用 python -m app.lib.table_router / python -m app.lib.value_index 离线构建缓存文件
+    WARMUP_MODELS = ["embedding-service"]